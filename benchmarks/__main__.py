@@ -0,0 +1,85 @@
+import argparse
+import sys
+import tempfile
+import tracemalloc
+from pathlib import Path
+from typing import Any
+
+from .cases import Operation, cases
+from .generate import build_book
+from .results import (
+    add_output_args,
+    best_of,
+    finish,
+    format_result,
+    meta,
+    positive_int,
+    time_runs,
+)
+
+DEFAULT_SIZES = [1_000, 100_000, 1_000_000]
+
+
+def parse_args(args: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=DEFAULT_SIZES,
+        help="numbers of contacts in the synthetic books (default: 1k 100k 1M)",
+    )
+    parser.add_argument(
+        "--cases",
+        nargs="+",
+        choices=sorted(cases),
+        default=list(cases),
+        metavar="CASE",
+        help=f"cases to run (default: all of {', '.join(cases)})",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=positive_int,
+        default=3,
+        help="timed runs per case, the best one is reported (default: 3)",
+    )
+    add_output_args(parser, regression="relative slowdown or memory growth")
+    return parser.parse_args(args)
+
+
+def measure(operation: Operation, repeat: int) -> dict[str, Any]:
+    timings = time_runs(operation, repeat)
+
+    # Peak memory is taken from a separate run, tracing distorts the timings
+    tracemalloc.start()
+    operation()
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {**best_of(timings), "peak_bytes": peak_bytes}
+
+
+def run(sizes: list[int], case_names: list[str], repeat: int) -> dict[str, Any]:
+    results: dict[str, Any] = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for size in sizes:
+            contacts = build_book(size)
+            for case_name in case_names:
+                operation = cases[case_name].setup(contacts, Path(tmp_dir))
+                operation()  # Warm up lazily built indexes and caches
+
+                key = f"{case_name}@{size}"
+                results[key] = measure(operation, repeat)
+                print(format_result(key, results[key]), flush=True)
+
+    return {"meta": meta(), "results": results}
+
+
+def main() -> None:
+    args = parse_args(sys.argv[1:])
+    results = run(args.sizes, args.cases, args.repeat)
+    finish(results, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+import io
+from contextlib import redirect_stdout
+from itertools import count
+from pathlib import Path
+from typing import Any, Callable, NamedTuple
+
+from bot.runner import commands_dispatcher, execute_command, execute_pipeline
+from bot.contacts import ContactsBook, ContactsService
+
+from .generate import contact_name
+
+# A case prepares its state and returns the operation that gets measured
+Operation = Callable[[], Any]
+CaseSetup = Callable[[ContactsBook, Path], Operation]
+
+BATCH_SIZE = 1000
+
+
+class Case(NamedTuple):
+    name: str
+    setup: CaseSetup
+
+
+cases: dict[str, Case] = {}
+
+
+def case(name: str) -> Callable[[CaseSetup], CaseSetup]:
+    def decorator(setup: CaseSetup) -> CaseSetup:
+        cases[name] = Case(name=name, setup=setup)
+        return setup
+
+    return decorator
+
+
+def _names(contacts: ContactsBook) -> list[str]:
+    return [contact_name(i * len(contacts) // BATCH_SIZE) for i in range(BATCH_SIZE)]
+
+
+@case("dispatcher.run_command")
+def run_commands(contacts: ContactsBook, tmp_dir: Path) -> Operation:
+    context = {"contacts": contacts, "contacts_service": ContactsService(contacts)}
+    names = _names(contacts)
+
+    def operation() -> None:
+        with redirect_stdout(io.StringIO()):
+            for name in names:
+                commands_dispatcher.run_command("phone", name, **context)
+
+    return operation
+
+
+@case("runner.execute_command")
+def execute_commands(contacts: ContactsBook, tmp_dir: Path) -> Operation:
+    # One input line per command
+    context = {"contacts": contacts, "contacts_service": ContactsService(contacts)}
+    names = _names(contacts)
+
+    def operation() -> None:
+        with redirect_stdout(io.StringIO()):
+            for name in names:
+                execute_command("phone", [name], **context)
+
+    return operation
+
+
+@case("runner.execute_pipeline")
+def execute_pipelines(contacts: ContactsBook, tmp_dir: Path) -> Operation:
+    # The same commands on one input line
+    context = {"contacts": contacts, "contacts_service": ContactsService(contacts)}
+    commands = [("phone", [name]) for name in _names(contacts)]
+
+    def operation() -> None:
+        with redirect_stdout(io.StringIO()):
+            execute_pipeline(commands, **context)
+
+    return operation
+
+
+@case("service.get_contact")
+def get_contacts(contacts: ContactsBook, tmp_dir: Path) -> Operation:
+    contacts_service = ContactsService(contacts)
+    names = _names(contacts)
+
+    def operation() -> None:
+        for name in names:
+            contacts_service.get_contact(name)
+
+    return operation
+
+
+def upcoming_birthdays(days: int) -> CaseSetup:
+    def setup(contacts: ContactsBook, tmp_dir: Path) -> Operation:
+        return lambda: contacts.get_upcoming_birthdays(days)
+
+    return setup
+
+
+# The 7 day window keeps its original name, so older baselines still compare
+case("book.get_upcoming_birthdays")(upcoming_birthdays(7))
+for days in (30, 90, 365):
+    case(f"book.get_upcoming_birthdays_{days}d")(upcoming_birthdays(days))
+
+
+@case("service.get_upcoming_birthdays")
+def cached_upcoming_birthdays(contacts: ContactsBook, tmp_dir: Path) -> Operation:
+    # Repeated with no change in between, so every run after the first is cached
+    contacts_service = ContactsService(contacts)
+    return lambda: contacts_service.get_upcoming_birthdays(30)
+
+
+@case("book.save")
+def save_book(contacts: ContactsBook, tmp_dir: Path) -> Operation:
+    path = tmp_dir / "save.book"
+    return lambda: contacts.save(path)
+
+
+@case("book.from_file")
+def load_book(contacts: ContactsBook, tmp_dir: Path) -> Operation:
+    path = tmp_dir / "load.book"
+    contacts.save(path)
+
+    def operation() -> None:
+        # Touch every record so lazily loaded formats pay the full cost
+        for _ in ContactsBook.from_file(path).values():
+            pass
+
+    return operation
+
+
+def _sharded_copy(contacts: ContactsBook, tmp_dir: Path) -> tuple[ContactsBook, Path]:
+    # A separate book, so the shared one keeps its storage for the other cases
+    path = tmp_dir / "sharded.book"
+    contacts.save(tmp_dir / "sharded.source")
+    path.mkdir(exist_ok=True)
+    sharded = ContactsBook.from_file(tmp_dir / "sharded.source")
+    sharded.save_backend = "sharded"
+    sharded.save(path)
+    return ContactsBook.from_file(path), path
+
+
+@case("book.save_sharded")
+def save_sharded_book(contacts: ContactsBook, tmp_dir: Path) -> Operation:
+    # One contact changed per save, so a single shard is rewritten
+    sharded, path = _sharded_copy(contacts, tmp_dir)
+    name = contact_name(0)
+    birthdays = ["01.01.2000", "02.02.2000"]
+
+    def operation() -> None:
+        sharded.find(name).add_birthday(birthdays[sharded.mutations % 2])
+        sharded.save(path)
+
+    return operation
+
+
+@case("book.from_file_sharded")
+def load_sharded_book(contacts: ContactsBook, tmp_dir: Path) -> Operation:
+    _, path = _sharded_copy(contacts, tmp_dir)
+
+    def operation() -> None:
+        for _ in ContactsBook.from_file(path).values():
+            pass
+
+    return operation
+
+
+def _sqlite_copy(contacts: ContactsBook, tmp_dir: Path) -> ContactsService:
+    # A separate book, so the shared one keeps its storage for the other cases
+    path = tmp_dir / "edits.db"
+    ContactsBook(contacts.data).save(path)
+    return ContactsService(ContactsBook.from_file(path))
+
+
+def _edit_birthdays(contacts_service: ContactsService, names: list[str]) -> None:
+    for i, name in enumerate(names):
+        contacts_service.add_birthday(name, birthday=f"{i % 28 + 1:02d}.01.2000")
+
+
+@case("sqlite.add_birthday")
+def edit_sqlite_book(contacts: ContactsBook, tmp_dir: Path) -> Operation:
+    # Every edit is committed on its own
+    contacts_service = _sqlite_copy(contacts, tmp_dir)
+    names = _names(contacts)
+    return lambda: _edit_birthdays(contacts_service, names)
+
+
+@case("sqlite.transaction")
+def edit_sqlite_book_in_transaction(
+    contacts: ContactsBook, tmp_dir: Path
+) -> Operation:
+    contacts_service = _sqlite_copy(contacts, tmp_dir)
+    names = _names(contacts)
+
+    def operation() -> None:
+        with contacts_service.transaction():
+            _edit_birthdays(contacts_service, names)
+
+    return operation
+
+
+@case("book.snapshot_values")
+def read_snapshot(contacts: ContactsBook, tmp_dir: Path) -> Operation:
+    # What a background report pays to read every record of a snapshot
+    def operation() -> None:
+        for _ in contacts.snapshot().values():
+            pass
+
+    return operation
+
+
+@case("service.add_birthday")
+def edit_book(contacts: ContactsBook, tmp_dir: Path) -> Operation:
+    contacts_service = ContactsService(contacts)
+    names = _names(contacts)
+    return lambda: _edit_birthdays(contacts_service, names)
+
+
+@case("service.add_birthday_snapshot")
+def edit_book_with_snapshot(contacts: ContactsBook, tmp_dir: Path) -> Operation:
+    # A fresh snapshot every run, so each edit copies its record once more
+    contacts_service = ContactsService(contacts)
+    names = _names(contacts)
+
+    def operation() -> None:
+        snapshot = contacts.snapshot()
+        _edit_birthdays(contacts_service, names)
+        del snapshot
+
+    return operation
+
+
+@case("service.create_contact")
+def create_contacts(contacts: ContactsBook, tmp_dir: Path) -> Operation:
+    # Grows the book, so it is registered last to keep other cases unaffected
+    contacts_service = ContactsService(contacts)
+    batches = count()
+
+    def operation() -> None:
+        batch = next(batches)
+        for i in range(BATCH_SIZE):
+            contacts_service.create_contact(
+                f"new{batch}-{i}", phone="0123456789", birthday="01.01.2000"
+            )
+
+    return operation
@@ -0,0 +1,92 @@
+import argparse
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any
+
+from bot.contacts import CODECS, ContactsBook
+
+from .generate import build_book
+from .results import (
+    add_output_args,
+    best_of,
+    finish,
+    format_result,
+    meta,
+    positive_int,
+    time_runs,
+)
+
+
+def parse_args(args: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.codecs")
+    parser.add_argument(
+        "--size",
+        type=int,
+        default=100_000,
+        help="number of contacts in the saved book (default: 100k)",
+    )
+    parser.add_argument(
+        "--codecs",
+        nargs="+",
+        choices=CODECS,
+        default=list(CODECS),
+        metavar="CODEC",
+        help=f"codecs to compare (default: all of {', '.join(CODECS)})",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=positive_int,
+        default=3,
+        help="saves and loads per codec, the best one is reported (default: 3)",
+    )
+    add_output_args(parser)
+    return parser.parse_args(args)
+
+
+def load(path: Path) -> None:
+    # Touch every record, so mapped and compressed books pay the full cost
+    for _ in ContactsBook.from_file(path).values():
+        pass
+
+
+def run(size: int, codecs: list[str], repeat: int) -> dict[str, Any]:
+    results: dict[str, Any] = {}
+    contacts = build_book(size)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for codec in codecs:
+            path = Path(tmp_dir) / f"contacts.{codec}"
+
+            def save() -> None:
+                # A fresh book and file every time, so each save encodes every
+                # record and has no other session's save to merge
+                path.unlink(missing_ok=True)
+                book = ContactsBook(contacts.data)
+                book.codec = codec  # type: ignore[assignment]
+                book.save(path)
+
+            save_result = best_of(time_runs(save, repeat))
+            file_bytes = path.stat().st_size
+
+            for key, result in (
+                (f"codecs.save_{codec}@{size}", save_result),
+                (f"codecs.load_{codec}@{size}", best_of(time_runs(lambda: load(path), repeat))),
+            ):
+                results[key] = {**result, "file_bytes": file_bytes}
+                print(
+                    f"{format_result(key, result)}"
+                    f" {file_bytes / 1024:>12.1f} KiB file"
+                )
+
+    return {"meta": meta(), "results": results}
+
+
+def main() -> None:
+    args = parse_args(sys.argv[1:])
+    results = run(args.size, args.codecs, args.repeat)
+    finish(results, args)
+
+
+if __name__ == "__main__":
+    main()
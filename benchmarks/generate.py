@@ -0,0 +1,22 @@
+import random
+
+from bot.contacts import ContactRecord, ContactsBook
+
+
+def contact_name(i: int) -> str:
+    return f"contact{i}"
+
+
+def build_book(size: int, *, seed: int = 0) -> ContactsBook:
+    rng = random.Random(seed)
+    contacts = ContactsBook()
+    for i in range(size):
+        record = ContactRecord(contact_name(i))
+        record.add_phone(f"{rng.randrange(10**10):010d}")
+        if rng.random() < 0.5:
+            record.add_phone(f"{rng.randrange(10**10):010d}")
+        record.add_birthday(
+            f"{rng.randint(1, 28):02d}.{rng.randint(1, 12):02d}.{rng.randint(1950, 2010)}"
+        )
+        contacts.add_record(record)
+    return contacts
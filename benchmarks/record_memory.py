@@ -0,0 +1,23 @@
+import pickle
+import sys
+import tracemalloc
+
+from .generate import build_book
+
+
+def main() -> None:
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+
+    tracemalloc.start()
+    contacts = build_book(size)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    pickle_size = len(pickle.dumps(contacts, protocol=pickle.HIGHEST_PROTOCOL))
+    print(f"contacts:             {size}")
+    print(f"memory per contact:   {memory / size:.1f} B")
+    print(f"pickle per contact:   {pickle_size / size:.1f} B")
+
+
+if __name__ == "__main__":
+    main()
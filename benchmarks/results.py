@@ -0,0 +1,107 @@
+import argparse
+import json
+import platform
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable
+
+
+def meta() -> dict[str, str]:
+    return {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+    }
+
+
+def positive_int(value: str) -> int:
+    # argparse type for counts that must be at least 1
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
+
+def add_output_args(
+    parser: argparse.ArgumentParser,
+    *,
+    regression: str = "relative slowdown",
+) -> None:
+    # Options shared by every benchmark, handled by finish()
+    parser.add_argument(
+        "-o", "--output", type=Path, help="write the results to a JSON file"
+    )
+    parser.add_argument(
+        "--compare",
+        type=Path,
+        metavar="BASELINE",
+        help="compare the results with a stored JSON baseline",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help=f"{regression} flagged as regression (default: 0.2)",
+    )
+
+
+def finish(results: dict[str, Any], args: argparse.Namespace) -> None:
+    # Writes the results and exits with 1 on a regression against the baseline
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+
+    if args.compare and not check_baseline(results, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+def time_runs(operation: Callable[[], Any], repeat: int) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        operation()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def best_of(timings: list[float]) -> dict[str, float]:
+    return {"seconds": min(timings), "mean_seconds": sum(timings) / len(timings)}
+
+
+def format_result(key: str, result: dict[str, Any]) -> str:
+    line = f"{key:<40} {result['seconds'] * 1000:>10.2f} ms"
+    if "peak_bytes" in result:
+        line += f" {result['peak_bytes'] / 1024:>12.1f} KiB peak"
+    return line
+
+
+def compare(
+    results: dict[str, Any], baseline: dict[str, Any], tolerance: float
+) -> list[str]:
+    regressions = []
+    for key, result in results["results"].items():
+        base = baseline["results"].get(key)
+        if base is None:
+            continue
+
+        for metric in ("seconds", "peak_bytes"):
+            if metric not in base or metric not in result:
+                continue
+            if base[metric] and result[metric] / base[metric] > 1 + tolerance:
+                regressions.append(
+                    f"{key}: {metric} {base[metric]:.6g} -> {result[metric]:.6g}"
+                    f" (+{(result[metric] / base[metric] - 1) * 100:.0f}%)"
+                )
+    return regressions
+
+
+def check_baseline(results: dict[str, Any], path: Path, tolerance: float) -> bool:
+    baseline = json.loads(path.read_text())
+    regressions = compare(results, baseline, tolerance)
+    if regressions:
+        print("\nRegressions against the baseline:")
+        print("\n".join(regressions))
+        return False
+    print("\nNo regressions against the baseline.")
+    return True
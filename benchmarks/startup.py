@@ -0,0 +1,160 @@
+import argparse
+import os
+import pty
+import select
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+from .generate import build_book, contact_name
+from .results import (
+    add_output_args,
+    best_of,
+    finish,
+    format_result,
+    meta,
+    positive_int,
+)
+
+ROOT = Path(__file__).resolve().parent.parent
+PROMPT = b"Enter a command: "
+TIMEOUT = 60.0
+
+
+def parse_args(args: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.startup")
+    parser.add_argument(
+        "--size",
+        type=int,
+        default=100_000,
+        help="number of contacts in the book the bot starts with (default: 100k)",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=positive_int,
+        default=5,
+        help="bot starts per measurement, the best one is reported (default: 5)",
+    )
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=15,
+        help="slowest imports to list in the import report (default: 15)",
+    )
+    add_output_args(parser)
+    return parser.parse_args(args)
+
+
+def import_times(module: str = "bot.__main__") -> list[tuple[str, int, int]]:
+    # Parsed from `python -X importtime`: module, self and cumulative microseconds
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = []
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line.removeprefix("import time:").split("|")
+        times.append((name.strip(), int(self_us), int(cumulative_us)))
+    return times
+
+
+def start_bot(book_path: Path) -> tuple[subprocess.Popen, int]:
+    # The bot only shows its prompt when talking to a terminal, and input()
+    # writes it to stderr then
+    master, slave = pty.openpty()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "bot", str(book_path)],
+        cwd=ROOT,
+        stdin=slave,
+        stdout=slave,
+        stderr=slave,
+        env={**os.environ, "PYTHONPATH": str(ROOT)},
+    )
+    os.close(slave)
+    return process, master
+
+
+def read_until(master: int, marker: bytes) -> None:
+    output = b""
+    deadline = time.monotonic() + TIMEOUT
+    while marker not in output:
+        ready, _, _ = select.select([master], [], [], deadline - time.monotonic())
+        if not ready:
+            raise TimeoutError(f"The bot didn't print {marker!r} in time")
+        output += os.read(master, 4096)
+
+
+def measure_start(book_path: Path, first_command: str) -> tuple[float, float]:
+    # Time to the first prompt, and to the prompt after the first command that
+    # needs the book, which waits for it to load
+    start = time.perf_counter()
+    process, master = start_bot(book_path)
+    try:
+        read_until(master, PROMPT)
+        first_prompt = time.perf_counter() - start
+        os.write(master, f"{first_command}\n".encode())
+        read_until(master, PROMPT)
+        first_command_done = time.perf_counter() - start
+        os.write(master, b"exit\n")
+        process.wait(TIMEOUT)
+    finally:
+        process.kill()
+        os.close(master)
+    return first_prompt, first_command_done
+
+
+def run(size: int, repeat: int, top: int) -> dict[str, Any]:
+    results: dict[str, Any] = {}
+
+    # The last module reported is the imported one, its cumulative time is
+    # the import time of the whole bot
+    runs = [import_times() for _ in range(repeat)]
+    results["startup.import"] = best_of([times[-1][2] / 1e6 for times in runs])
+    print(format_result("startup.import", results["startup.import"]))
+    fastest_run = min(runs, key=lambda times: times[-1][2])
+    for name, self_us, cumulative_us in sorted(
+        fastest_run, key=lambda item: item[1], reverse=True
+    )[:top]:
+        print(
+            f"  {name:<38} {self_us / 1000:>10.2f} ms self"
+            f" {cumulative_us / 1000:>10.2f} ms cumulative"
+        )
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        book_path = Path(tmp_dir) / "contacts.pkl"
+        build_book(size).save(book_path)
+
+        first_prompts, first_commands = [], []
+        for _ in range(repeat):
+            first_prompt, first_command = measure_start(
+                book_path, f"phone {contact_name(size - 1)}"
+            )
+            first_prompts.append(first_prompt)
+            first_commands.append(first_command)
+
+    for key, timings in (
+        (f"startup.first_prompt@{size}", first_prompts),
+        (f"startup.first_command@{size}", first_commands),
+    ):
+        results[key] = best_of(timings)
+        print(format_result(key, results[key]))
+
+    return {"meta": meta(), "results": results}
+
+
+def main() -> None:
+    args = parse_args(sys.argv[1:])
+    results = run(args.size, args.repeat, args.top)
+    finish(results, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,79 +1,283 @@
+import argparse
+import json
+import os
 import sys
 from pathlib import Path
+from typing import Any, Iterable, NamedTuple
 
-from bot.bot_commands import StopCommandsLoop, bot_commands
-from bot.commands import (
-    CommandNotFoundError,
-    CommandsDispatcher,
-    InvalidCommandArgumentsError,
+from bot.bot_commands import StopCommandsLoop
+from bot.commands import CommandStats
+from bot.contacts import (
+    CODECS,
+    STORAGE_BACKENDS,
+    AutoSaver,
+    ContactsBook,
+    ContactsJournal,
+    ContactsService,
+    Codec,
+    StorageBackend,
+)
+from bot.runner import (
+    BackgroundReports,
+    Deferred,
+    commands_dispatcher,
+    execute_pipeline,
+    print_reports,
 )
-from bot.contacts import ContactsBook, ContactsService
 
-commands_dispatcher = CommandsDispatcher(bot_commands)
 
+def parse_args(args: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m bot")
+    parser.add_argument(
+        "contacts_path",
+        nargs="?",
+        type=Path,
+        default=Path("contacts.pkl"),
+        help="path to the contacts book (default: contacts.pkl)",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=STORAGE_BACKENDS,
+        help="how the book is stored (default: sharded for directories, sqlite "
+        "for .db/.sqlite files, otherwise mapped)",
+    )
+    parser.add_argument(
+        "--codec",
+        choices=CODECS,
+        help="compress a mapped book with CODEC when it is saved (default: as "
+        "the book file is, none for a new one)",
+    )
+    parser.add_argument(
+        "--script",
+        metavar="FILE",
+        help="run commands from FILE line by line without prompts ('-' for stdin)",
+    )
+    parser.add_argument(
+        "--serve",
+        metavar="ADDRESS",
+        help="serve the bot to clients on HOST:PORT or unix:PATH (see bot.client)",
+    )
+    parser.add_argument(
+        "--on-error",
+        choices=["continue", "stop"],
+        default="continue",
+        help="what to do when a command fails in script mode or in a ';' "
+        "separated pipeline (default: continue)",
+    )
+    parser.add_argument(
+        "--unique-phones",
+        action="store_true",
+        help="forbid assigning one phone number to several contacts",
+    )
+    parser.add_argument(
+        "--autosave-interval",
+        metavar="SECONDS",
+        type=float,
+        default=30.0,
+        help="save unsaved changes in the background this often, 0 to disable "
+        "(default: 30)",
+    )
+    parser.add_argument(
+        "--autosave-mutations",
+        metavar="N",
+        type=int,
+        default=100,
+        help="also save in the background after N changes (default: 100)",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        default=os.environ.get("BOT_STATS", "").lower() in {"1", "true", "yes"},
+        help="record per-command call counts and latencies (or set BOT_STATS=1)",
+    )
+    parser.add_argument(
+        "--stats-json",
+        metavar="FILE",
+        type=Path,
+        help="dump command stats as JSON to FILE on exit (implies --stats)",
+    )
+    return parser.parse_args(args)
 
-def parse_args(args: list[str]) -> Path:
-    if len(args) > 1:
-        print(f"Usage: python -m bot [path_to_contacts_book]")
-        print(f"Expected 0 or 1 arguments, got {len(args)}")
-        sys.exit(1)
 
-    return Path(args[0]) if args else Path("contacts.pkl")
+class Session(NamedTuple):
+    contacts: ContactsBook
+    contacts_service: ContactsService
+    journal: ContactsJournal | None
+    autosaver: AutoSaver | None
 
 
-def load_contacts(path: Path) -> ContactsBook:
+def load_contacts(
+    path: Path, backend: StorageBackend | None, codec: Codec | None
+) -> ContactsBook:
     try:
-        return ContactsBook.from_file(path)
+        return ContactsBook.from_file(path, backend=backend, codec=codec)
     except IsADirectoryError:
         print(f"File is expected, not a directory: '{path.name}'")
         sys.exit(1)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
 
 
-def handle_invalid_command_args_error(error: InvalidCommandArgumentsError) -> None:
-    if error.required_args and error.optional_args:
-        print(
-            f"Give me {error.required_args_str} please, and optionally {error.optional_args_str}."
-        )
-    elif error.required_args:
-        print(f"Give me {error.required_args_str} pleaserror.")
-    elif error.optional_args:
-        print(f"You can optionally provide {error.optional_args_str}.")
-    else:
-        print("This command doesn't take any arguments.")
+def open_session(args: argparse.Namespace) -> Session:
+    contacts = load_contacts(args.contacts_path, args.backend, args.codec)
+    contacts.unique_phones = args.unique_phones
 
+    # SQLite books commit every change, only the others are journaled and saved
+    journal = autosaver = None
+    if contacts.backend != "sqlite":
+        journal = ContactsJournal(args.contacts_path)
+        if args.autosave_interval > 0:
+            autosaver = AutoSaver(
+                contacts,
+                journal,
+                interval=args.autosave_interval,
+                max_mutations=args.autosave_mutations,
+            )
+            autosaver.start()
 
-def main() -> None:
-    contacts_path = parse_args(sys.argv[1:])
-    contacts = load_contacts(contacts_path)
-    contacts_service = ContactsService(contacts)
+    contacts_service = ContactsService(contacts, journal=journal)
+    return Session(contacts, contacts_service, journal, autosaver)
 
-    # Run commands in a loop
+
+def close_session(session: Session) -> list[str]:
+    # The journal is folded into a fresh snapshot at the end, unless there is
+    # nothing to fold: saving a clean book would still make every other
+    # session merge the new generation
+    conflicts = []
+    contacts = session.contacts
+    if session.autosaver is not None:
+        session.autosaver.stop()
+        conflicts = session.autosaver.conflicts
+    if session.journal is not None:
+        if (
+            contacts.is_dirty
+            or contacts.recovered_journals
+            or session.journal.has_entries
+        ):
+            conflicts = sorted({*conflicts, *session.journal.compact(contacts)})
+        session.journal.close()
+    contacts.close()
+    return conflicts
+
+
+def run_interactive(*, stop_on_error: bool, **context: Any) -> None:
     print("Welcome to the assistant bot!")
+    reports = BackgroundReports()
     while True:
-        command, command_args = commands_dispatcher.input_command("Enter a command: ")
-        if not command:
+        print_reports(reports.pop_finished())
+        try:
+            commands = commands_dispatcher.input_pipeline("Enter a command: ")
+        except (EOFError, KeyboardInterrupt):
+            # Ctrl-D or Ctrl-C at the prompt exits like the exit command
+            print()
+            break
+        if not commands:
+            continue
+
+        try:
+            execute_pipeline(
+                commands, stop_on_error=stop_on_error, reports=reports, **context
+            )
+        except StopCommandsLoop:
+            break
+
+    # Reports still running are waited for, the session is saved after them
+    print_reports(reports.pop_finished(wait=True))
+
+
+def run_script(lines: Iterable[str], *, stop_on_error: bool, **context: Any) -> int:
+    # Let stdout buffer freely instead of flushing on every printed line
+    sys.stdout.reconfigure(line_buffering=False)
+
+    failed = 0
+    reports = BackgroundReports()
+    for line in lines:
+        print_reports(reports.pop_finished())
+        commands = commands_dispatcher.parse_pipeline(line)
+        if not commands:
             continue
 
         try:
-            commands_dispatcher.run_command(
-                command,
-                *command_args,
-                contacts=contacts,
-                contacts_service=contacts_service,
+            line_failed = execute_pipeline(
+                commands, stop_on_error=stop_on_error, reports=reports, **context
             )
-        except CommandNotFoundError:
-            print("Invalid command.")
-        except InvalidCommandArgumentsError as e:
-            handle_invalid_command_args_error(e)
-        except ValueError as e:
-            print(e)
         except StopCommandsLoop:
             break
-        except Exception as e:
-            print(f"Whoops, an unexpected error occurred: {e}")
 
-    # Save contacts at the end
-    contacts.save(contacts_path)
+        failed += line_failed
+        if line_failed and stop_on_error:
+            break
+
+    print_reports(reports.pop_finished(wait=True))
+    sys.stdout.flush()
+    return 1 if failed else 0
+
+
+def run(args: argparse.Namespace, **context: Any) -> int:
+    stop_on_error = args.on_error == "stop"
+    if args.serve:
+        # asyncio alone takes longer to import than the rest of the bot
+        import asyncio
+
+        from bot.server import serve
+
+        try:
+            asyncio.run(serve(args.serve, stop_on_error=stop_on_error, **context))
+        except KeyboardInterrupt:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"Cannot serve on '{args.serve}': {e}")
+            return 1
+        return 0
+
+    if args.script is not None or not sys.stdin.isatty():
+        if args.script in (None, "-"):
+            return run_script(sys.stdin, stop_on_error=stop_on_error, **context)
+        try:
+            with open(args.script, encoding="utf-8") as script:
+                return run_script(script, stop_on_error=stop_on_error, **context)
+        except OSError as e:
+            print(f"Cannot read script '{args.script}': {e.strerror}")
+            return 1
+
+    run_interactive(stop_on_error=stop_on_error, **context)
+    return 0
+
+
+def main() -> None:
+    args = parse_args(sys.argv[1:])
+    if args.stats or args.stats_json:
+        commands_dispatcher.stats = CommandStats(ignored_errors=(StopCommandsLoop,))
+
+    # The book loads in the background while the prompt is already up, the
+    # first command that needs it waits for the load to finish
+    session = Deferred(lambda: open_session(args))
+    context = {
+        "contacts": Deferred(lambda: session.result().contacts),
+        "contacts_service": Deferred(lambda: session.result().contacts_service),
+        "command_stats": commands_dispatcher.stats,
+    }
+
+    # Run commands from a script, a pipe or in an interactive loop. Whatever
+    # ends them, the session is closed and its changes saved
+    exit_code = 0
+    try:
+        exit_code = run(args, **context)
+    except KeyboardInterrupt:
+        exit_code = 130
+    finally:
+        conflicts = close_session(session.result())
+        if conflicts:
+            print(
+                "These contacts were also changed by another session, "
+                f"kept the changes from this one: {', '.join(conflicts)}"
+            )
+
+    if args.stats_json and commands_dispatcher.stats is not None:
+        stats = commands_dispatcher.stats.to_dict()
+        args.stats_json.write_text(json.dumps(stats, indent=2))
+    sys.exit(exit_code)
 
 
 if __name__ == "__main__":
@@ -1,9 +1,50 @@
+from typing import Iterable, Iterator
+
 from bot.commands import CommandArgs, CommandContext, CommandsRegistry
-from bot.contacts import ContactAlreadyExistsError, ContactNotFoundError
+from bot.contacts import MAX_UPCOMING_DAYS, ContactNotFoundError, ContactRecord
 
 bot_commands = CommandsRegistry()
 
 
+def format_contacts(contacts: Iterable[ContactRecord]) -> Iterator[str]:
+    for contact in contacts:
+        yield f"{contact.name}: {contact.phones[0] if contact.phones else '-'}"
+
+
+def parse_options(args: CommandArgs, *, allowed: list[str]) -> dict[str, str]:
+    options: dict[str, str] = {}
+    for arg in args:
+        if arg is None:
+            continue
+
+        key, sep, value = arg.removeprefix("--").partition("=")
+        if not arg.startswith("--") or not sep or key not in allowed:
+            allowed_str = ", ".join(f"--{option}=..." for option in allowed)
+            raise ValueError(f"Unknown option '{arg}'. Use {allowed_str}")
+        options[key] = value
+    return options
+
+
+def parse_positive_int(value: str, label: str) -> int:
+    if not (value.isascii() and value.isdigit()) or int(value) < 1:
+        raise ValueError(f"{label} must be a positive number")
+    return int(value)
+
+
+def parse_days(value: str) -> int:
+    # int() also takes non-ASCII digits, and refuses or overflows on huge values
+    digits = value.lstrip("0") or "0"
+    if (
+        not (value.isascii() and value.isdigit())
+        or len(digits) > len(str(MAX_UPCOMING_DAYS))
+        or int(digits) > MAX_UPCOMING_DAYS
+    ):
+        raise ValueError(
+            f"Number of days must be an integer from 0 to {MAX_UPCOMING_DAYS}"
+        )
+    return int(digits)
+
+
 @bot_commands.register("hello")
 def say_hello() -> None:
     print("How can I help you?")
@@ -14,14 +55,11 @@ def add_contact(args: CommandArgs, context: CommandContext) -> None:
     name, phone = args
     contacts_service = context["contacts_service"]
 
-    try:
-        match contacts_service.add_contact(name, phone=phone):
-            case "added":
-                print("Contact added.")
-            case "updated:phone":
-                print("Phone number added.")
-    except ContactAlreadyExistsError:
-        print("Contact already exists.")
+    match contacts_service.add_contact(name, phone=phone):
+        case "added":
+            print("Contact added.")
+        case "updated:phone":
+            print("Phone number added.")
 
 
 @bot_commands.register("change", args=["name", "old phone number", "new phone number"])
@@ -29,11 +67,8 @@ def change_phone(args: CommandArgs, context: CommandContext) -> None:
     name, old_phone, new_phone = args
     contacts_service = context["contacts_service"]
 
-    try:
-        contacts_service.update_contact(name, phone=(old_phone, new_phone))
-        print("Contact updated.")
-    except ContactNotFoundError:
-        print("Contact doesn't exist.")
+    contacts_service.update_contact(name, phone=(old_phone, new_phone))
+    print("Contact updated.")
 
 
 @bot_commands.register("phone", args=["name"])
@@ -43,8 +78,7 @@ def show_phone(args: CommandArgs, context: CommandContext) -> None:
 
     contact = contacts_service.get_contact(name)
     if not contact:
-        print("Contact doesn't exist.")
-        return
+        raise ContactNotFoundError(f"Contact '{name}' does not exist.")
 
     if not contact.phones:
         print("This contact doesn't have a phone number.")
@@ -53,17 +87,64 @@ def show_phone(args: CommandArgs, context: CommandContext) -> None:
     print(contact.phones[0])
 
 
-@bot_commands.register("all")
-def show_all(context: CommandContext) -> None:
-    contacts = context["contacts"]
+@bot_commands.register("find-by-phone", args=["phone number"])
+def find_by_phone(args: CommandArgs, context: CommandContext) -> None:
+    phone = args[0]
+    contacts_service = context["contacts_service"]
+
+    contacts = contacts_service.find_contacts_by_phone(phone)
+    if contacts:
+        print("\n".join(str(contact.name) for contact in contacts))
+    else:
+        print("No contacts with this phone number.")
+
+
+@bot_commands.register("search", args=["name"])
+def search(args: CommandArgs, context: CommandContext) -> None:
+    query = args[0]
+    contacts_service = context["contacts_service"]
+
+    contacts = contacts_service.search_contacts(query)
     if contacts:
-        print(
-            "\n".join(
-                f"{contact.name}: {contact.phones[0] if contact.phones else '-'}"
-                for contact in contacts.values()
-            )
+        print("\n".join(format_contacts(contacts)))
+    else:
+        print("No matching contacts.")
+
+
+@bot_commands.register(
+    "all",
+    optional_args=["--page=N", "--limit=N", "--sort=KEY", "--name=PREFIX"],
+    report=True,
+)
+def show_all(args: CommandArgs, context: CommandContext) -> None:
+    options = parse_options(args, allowed=["page", "limit", "sort", "name"])
+    contacts = context["contacts"]
+    contacts_service = context["contacts_service"]
+
+    limit = options.get("limit")
+    page = options.get("page")
+    sort = options.get("sort", "none")
+    name_prefix = options.get("name")
+    if page is not None and limit is None:
+        # Without a limit the whole listing is one page
+        raise ValueError("Page needs a page size, add --limit=N")
+    limit_number = parse_positive_int(limit, "Limit") if limit is not None else None
+    page_number = parse_positive_int(page, "Page") if page is not None else 1
+
+    records: Iterable[ContactRecord]
+    if limit_number is not None:
+        records = contacts_service.list_contacts(
+            sort=sort, name_prefix=name_prefix, limit=limit_number, page=page_number
         )
     else:
+        # Print contacts one by one instead of building the whole listing
+        records = contacts.cursor(sort=sort, name_prefix=name_prefix)
+
+    printed = False
+    for line in format_contacts(records):
+        print(line)
+        printed = True
+    if not printed:
         print("No contacts.")
 
 
@@ -72,14 +153,11 @@ def add_birthday(args: CommandArgs, context: CommandContext) -> None:
     name, birthday = args
     contacts_service = context["contacts_service"]
 
-    try:
-        match contacts_service.add_birthday(name, birthday=birthday):
-            case "added":
-                print("Birthday added.")
-            case "updated":
-                print("Birthday updated.")
-    except ContactNotFoundError:
-        print("Contact doesn't exist.")
+    match contacts_service.add_birthday(name, birthday=birthday):
+        case "added":
+            print("Birthday added.")
+        case "updated":
+            print("Birthday updated.")
 
 
 @bot_commands.register("show-birthday", args=["name"])
@@ -88,16 +166,20 @@ def show_birthday(args: CommandArgs, context: CommandContext) -> None:
     contacts_service = context["contacts_service"]
 
     contact = contacts_service.get_contact(name)
-    if contact:
-        birthday = contact.get_birthday()
-        print(birthday or "Contact doesn't have a birthday set.")
-    else:
-        print("Contact doesn't exist.")
+    if not contact:
+        raise ContactNotFoundError(f"Contact '{name}' does not exist.")
+
+    birthday = contact.get_birthday()
+    print(birthday or "Contact doesn't have a birthday set.")
 
 
-@bot_commands.register("birthdays")
-def birthdays(context: CommandContext) -> None:
+@bot_commands.register("birthdays", optional_args=["days"], report=True)
+def birthdays(args: CommandArgs, context: CommandContext) -> None:
+    days_arg = args[0]
     contacts = context["contacts"]
+    contacts_service = context["contacts_service"]
+
+    days = parse_days(days_arg) if days_arg is not None else 7
 
     if not contacts:
         print("No contacts.")
@@ -107,7 +189,7 @@ def birthdays(context: CommandContext) -> None:
         print("No contacts with birthdays.")
         return
 
-    upcoming_birthdays = contacts.get_upcoming_birthdays()
+    upcoming_birthdays = contacts_service.get_upcoming_birthdays(days)
     if not upcoming_birthdays:
         print("No contacts with upcoming birthdays.")
         return
@@ -120,6 +202,59 @@ def birthdays(context: CommandContext) -> None:
     )
 
 
+@bot_commands.register("import", args=["file"], local=True)
+def import_contacts(args: CommandArgs, context: CommandContext) -> None:
+    path = args[0]
+    contacts_service = context["contacts_service"]
+
+    try:
+        report = contacts_service.import_contacts(path)
+    except OSError as e:
+        raise ValueError(f"Cannot read '{path}': {e.strerror}") from e
+
+    for row_number, error in report.errors:
+        print(f"Row {row_number}: {error}")
+    print(f"Imported {report.imported} contacts, {len(report.errors)} rows failed.")
+
+
+@bot_commands.register("export", args=["file"], report=True, local=True)
+def export_contacts(args: CommandArgs, context: CommandContext) -> None:
+    path = args[0]
+    contacts_service = context["contacts_service"]
+
+    try:
+        exported = contacts_service.export_contacts(path)
+    except OSError as e:
+        raise ValueError(f"Cannot write '{path}': {e.strerror}") from e
+
+    print(f"Exported {exported} contacts.")
+
+
+@bot_commands.register("stats")
+def show_stats(context: CommandContext) -> None:
+    command_stats = context["command_stats"]
+
+    if command_stats is None:
+        print("Command stats are disabled. Run with --stats or BOT_STATS=1.")
+        return
+
+    if not command_stats:
+        print("No commands recorded yet.")
+        return
+
+    print(
+        "\n".join(
+            f"{name}: {metrics.calls} calls, {metrics.errors} errors, "
+            f"p50 {metrics.percentile(50) * 1000:.3f} ms, "
+            f"p95 {metrics.percentile(95) * 1000:.3f} ms, "
+            f"p99 {metrics.percentile(99) * 1000:.3f} ms"
+            for name, metrics in command_stats.items()
+        )
+    )
+    query_cache = context["contacts_service"].query_cache
+    print(f"Query cache: {query_cache.hits} hits, {query_cache.misses} misses")
+
+
 class StopCommandsLoop(Exception):
     pass
 
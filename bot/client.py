@@ -0,0 +1,56 @@
+import socket
+import sys
+
+from bot.server import RESPONSE_END, parse_address
+
+
+def connect(address: str) -> socket.socket:
+    host, port = parse_address(address)
+    if host == "unix":
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(str(port))
+        return sock
+    return socket.create_connection((host, port))
+
+
+def main() -> None:
+    if len(sys.argv) != 2:
+        print("Usage: python -m bot.client HOST:PORT|unix:PATH")
+        sys.exit(1)
+
+    try:
+        sock = connect(sys.argv[1])
+    except (OSError, ValueError) as e:
+        print(f"Cannot connect to '{sys.argv[1]}': {e}")
+        sys.exit(1)
+
+    interactive = sys.stdin.isatty()
+    if interactive:
+        print("Welcome to the assistant bot!")
+
+    with sock, sock.makefile("rb") as responses:
+        while True:
+            try:
+                line = input("Enter a command: " if interactive else "")
+            except EOFError:
+                break
+
+            try:
+                sock.sendall(line.encode() + b"\n")
+                response = b""
+                while (response_line := responses.readline()) not in (
+                    RESPONSE_END,
+                    b"",
+                ):
+                    response += response_line
+            except ConnectionError:
+                # The server closed the session, e.g. after "exit"
+                break
+
+            print(response.decode(), end="")
+            if not response_line:
+                break
+
+
+if __name__ == "__main__":
+    main()
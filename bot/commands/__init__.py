@@ -1,4 +1,11 @@
-from .dispatcher import CommandArgs, CommandContext, CommandsDispatcher
+from .dispatcher import (
+    BACKGROUND_MARKER,
+    PIPELINE_SEPARATOR,
+    CommandArgs,
+    CommandContext,
+    CommandsDispatcher,
+    ParsedCommand,
+)
 from .errors import (
     CommandAlreadyExistsError,
     CommandError,
@@ -7,3 +14,4 @@ from .errors import (
     InvalidCommandArgumentsError,
 )
 from .registry import CommandsRegistry
+from .stats import CommandMetrics, CommandStats
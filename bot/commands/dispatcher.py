@@ -1,69 +1,108 @@
-import inspect
-from typing import Any, get_type_hints
+import time
+from typing import Any
 
-from .errors import ForbiddenCommandArgumentError, InvalidCommandArgumentsError
-from .registry import CommandsRegistry
+from .errors import InvalidCommandArgumentsError
+from .registry import Command, CommandArgs, CommandContext, CommandsRegistry
+from .stats import CommandStats
 
-CommandArgs = tuple[str, ...]
-CommandContext = dict[str, Any]
+PIPELINE_SEPARATOR = ";"
+# Ends a report command that should run in the background
+BACKGROUND_MARKER = "&"
+
+ParsedCommand = tuple[str, list[str]]
 
 
 class CommandsDispatcher:
-    def __init__(self, registry: CommandsRegistry) -> None:
+    def __init__(
+        self,
+        registry: CommandsRegistry,
+        *,
+        stats: CommandStats | None = None,
+    ) -> None:
         self._registry = registry
+        self.stats = stats
 
     def input_command(self, prompt: str) -> tuple[str | None, list[str]]:
-        user_input = input(prompt).strip()
-        if not user_input:
+        return self.parse_command(input(prompt))
+
+    def input_pipeline(self, prompt: str) -> list[ParsedCommand]:
+        return self.parse_pipeline(input(prompt))
+
+    def parse_command(self, line: str) -> tuple[str | None, list[str]]:
+        parts = line.split()
+        if not parts:
             return None, []
 
-        command, *args = user_input.split()
+        command, *args = parts
         command = command.lower()
         return command, args
 
+    def parse_pipeline(self, line: str) -> list[ParsedCommand]:
+        # Commands separated by ';', empty ones are skipped
+        commands = []
+        for part in line.split(PIPELINE_SEPARATOR):
+            command, args = self.parse_command(part)
+            if command:
+                commands.append((command, args))
+        return commands
+
+    def takes_context(self, command_name: str) -> bool:
+        return bool(self._registry.get(command_name).context_params)
+
+    def is_report(self, command_name: str) -> bool:
+        return self._registry.get(command_name).report
+
+    def is_local(self, command_name: str) -> bool:
+        return self._registry.get(command_name).local
+
     def run_command(self, command_name: str, *args: str, **kwargs: Any) -> None:
         command = self._registry.get(command_name)
+        if self.stats is None:
+            self._call_command(command, args, kwargs)
+            return
+
+        error = False
+        start = time.perf_counter_ns()
+        try:
+            self._call_command(command, args, kwargs)
+        except Exception as e:
+            error = not isinstance(e, self.stats.ignored_errors)
+            raise
+        finally:
+            self.stats.record(
+                command_name, time.perf_counter_ns() - start, error=error
+            )
+
+    def _call_command(
+        self, command: Command, args: tuple[str, ...], kwargs: dict[str, Any]
+    ) -> None:
+        command_name = command.name
         command_args: dict[str, Any] = {}
 
-        sig = inspect.signature(command.func)
-        hints = get_type_hints(command.func)
-
-        for param_name, _ in sig.parameters.items():
-            param_type = hints.get(param_name)
-
-            # Check args quantity & inject them
-            if param_type == CommandArgs:
-                required_args_n = len(command.required_args)
-                optional_args_n = len(command.optional_args)
-                min_args_n = required_args_n
-                max_args_n = required_args_n + optional_args_n
-
-                if max_args_n == 0 and len(args) > 0:
-                    raise InvalidCommandArgumentsError(
-                        f"Command '{command_name}' does not expect any args"
-                    )
-                elif not (min_args_n <= len(args) <= max_args_n):
-                    raise InvalidCommandArgumentsError(
-                        (
-                            f"Command '{command_name}' requires {min_args_n} args"
-                            if min_args_n == max_args_n
-                            else f"Command '{command_name}' requires {min_args_n} (+{max_args_n} optional) args"
-                        ),
-                        required_args=command.required_args,
-                        optional_args=command.optional_args,
-                    )
-
-                optional_defaults = (None,) * (max_args_n - len(args))
-                command_args[param_name] = args + optional_defaults
-
-            # Inject context
-            if param_type == CommandContext:
-                command_args[param_name] = kwargs
-
-            # Forbid all other arguments
-            if param_type != CommandArgs and param_type != CommandContext:
-                raise ForbiddenCommandArgumentError(
-                    f"Argument '{param_name}' with '{param_type}' type is not allowed."
+        # Check args quantity & inject them
+        if command.args_params:
+            args_n = len(args)
+            if command.max_args_n == 0 and args_n > 0:
+                raise InvalidCommandArgumentsError(
+                    f"Command '{command_name}' does not expect any args"
                 )
+            elif not (command.min_args_n <= args_n <= command.max_args_n):
+                raise InvalidCommandArgumentsError(
+                    (
+                        f"Command '{command_name}' requires {command.min_args_n} args"
+                        if command.min_args_n == command.max_args_n
+                        else f"Command '{command_name}' requires {command.min_args_n} (+{command.max_args_n} optional) args"
+                    ),
+                    required_args=command.required_args,
+                    optional_args=command.optional_args,
+                )
+
+            padded_args = args + command.optional_defaults[args_n:]
+            for param_name in command.args_params:
+                command_args[param_name] = padded_args
+
+        # Inject context
+        for param_name in command.context_params:
+            command_args[param_name] = kwargs
 
         command.func(**command_args)
@@ -17,6 +17,59 @@ class Command(NamedTuple):
     func: Callable
     required_args: list[str]
     optional_args: list[str]
+    # Binding plan compiled once at registration time
+    args_params: tuple[str, ...]
+    context_params: tuple[str, ...]
+    min_args_n: int
+    max_args_n: int
+    optional_defaults: tuple[None, ...]
+    # Only reads the book, so it may run on a snapshot in the background
+    report: bool
+    # Reads or writes files on the bot's host, so server clients can't run it
+    local: bool
+
+
+def compile_command(
+    name: str,
+    func: Callable,
+    required_args: list[str],
+    optional_args: list[str],
+    *,
+    report: bool = False,
+    local: bool = False,
+) -> Command:
+    sig = inspect.signature(func)
+    hints = get_type_hints(func)
+
+    args_params: list[str] = []
+    context_params: list[str] = []
+    for param_name in sig.parameters:
+        param_type = hints.get(param_name)
+        if param_type == CommandArgs:
+            args_params.append(param_name)
+        elif param_type == CommandContext:
+            context_params.append(param_name)
+        else:
+            # Forbid all other arguments
+            raise ForbiddenCommandArgumentError(
+                f"Argument '{param_name}' with '{param_type}' type is not allowed."
+            )
+
+    min_args_n = len(required_args)
+    max_args_n = min_args_n + len(optional_args)
+    return Command(
+        name=name,
+        func=func,
+        required_args=required_args,
+        optional_args=optional_args,
+        args_params=tuple(args_params),
+        context_params=tuple(context_params),
+        min_args_n=min_args_n,
+        max_args_n=max_args_n,
+        optional_defaults=(None,) * max_args_n,
+        report=report,
+        local=local,
+    )
 
 
 class CommandsRegistry:
@@ -28,6 +81,8 @@ class CommandsRegistry:
         *command_names: str,
         args: list[str] | None = None,
         optional_args: list[str] | None = None,
+        report: bool = False,
+        local: bool = False,
     ) -> Callable:
         def decorator(func: Callable) -> Callable:
             for name in command_names:
@@ -35,11 +90,13 @@ class CommandsRegistry:
                     raise CommandAlreadyExistsError(
                         f"Command '{name}' is already registered."
                     )
-                self._registry[name] = Command(
-                    name=name,
-                    func=func,
-                    required_args=args or [],
-                    optional_args=optional_args or [],
+                self._registry[name] = compile_command(
+                    name,
+                    func,
+                    args or [],
+                    optional_args or [],
+                    report=report,
+                    local=local,
                 )
             return func
 
@@ -0,0 +1,75 @@
+import math
+import threading
+from typing import Any
+
+# Latencies go into log-scale buckets, four per doubling (~19% resolution),
+# so recording is O(1) and memory doesn't grow with the number of calls
+BUCKETS_PER_DOUBLING = 4
+
+
+class CommandMetrics:
+    def __init__(self) -> None:
+        self.calls = 0
+        self.errors = 0
+        self.total_ns = 0
+        self.buckets: dict[int, int] = {}
+
+    def record(self, elapsed_ns: int, *, error: bool) -> None:
+        self.calls += 1
+        self.total_ns += elapsed_ns
+        if error:
+            self.errors += 1
+        bucket = int(math.log2(elapsed_ns or 1) * BUCKETS_PER_DOUBLING)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def percentile(self, percent: float) -> float:
+        # Upper bound of the bucket holding the percentile, in seconds
+        rank = math.ceil(self.calls * percent / 100)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return 2 ** ((bucket + 1) / BUCKETS_PER_DOUBLING) / 1e9
+        return 0.0
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "mean_seconds": self.total_ns / self.calls / 1e9 if self.calls else 0.0,
+            "p50_seconds": self.percentile(50),
+            "p95_seconds": self.percentile(95),
+            "p99_seconds": self.percentile(99),
+        }
+
+
+class CommandStats:
+    def __init__(
+        self,
+        *,
+        ignored_errors: tuple[type[BaseException], ...] = (),
+    ) -> None:
+        # Exceptions used for control flow (e.g. stopping the loop) aren't errors
+        self.ignored_errors = ignored_errors
+        self._metrics: dict[str, CommandMetrics] = {}
+        # Background reports record their commands from worker threads
+        self._lock = threading.Lock()
+
+    def record(self, command_name: str, elapsed_ns: int, *, error: bool) -> None:
+        with self._lock:
+            metrics = self._metrics.get(command_name)
+            if metrics is None:
+                metrics = self._metrics[command_name] = CommandMetrics()
+            metrics.record(elapsed_ns, error=error)
+
+    def __bool__(self) -> bool:
+        return bool(self._metrics)
+
+    def items(self) -> list[tuple[str, CommandMetrics]]:
+        with self._lock:
+            return sorted(self._metrics.items(), key=lambda item: -item[1].calls)
+
+    def to_dict(self) -> dict[str, Any]:
+        items = self.items()
+        with self._lock:
+            return {name: metrics.to_dict() for name, metrics in items}
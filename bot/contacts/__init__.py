@@ -1,3 +1,9 @@
+from .autosave import AutoSaver
+from .cache import QueryCache
+from .cursor import ContactsCursor
 from .errors import ContactAlreadyExistsError, ContactNotFoundError, ContactsError
-from .models import ContactRecord, ContactsBook
+from .exchange import ContactRow, ImportReport
+from .journal import ContactsJournal
+from .models import MAX_UPCOMING_DAYS, ContactRecord, ContactsBook
 from .service import ContactsService
+from .storage import CODECS, STORAGE_BACKENDS, Codec, StorageBackend
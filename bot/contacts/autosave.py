@@ -0,0 +1,65 @@
+import sys
+import threading
+import time
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .journal import ContactsJournal
+    from .models import ContactsBook
+
+
+class AutoSaver:
+    # Saves the book from a background thread once it has been changed for
+    # `interval` seconds or `max_mutations` times, whichever comes first. The
+    # book lock is only held while a snapshot is taken, not while writing it
+    def __init__(
+        self,
+        contacts: "ContactsBook",
+        journal: "ContactsJournal",
+        *,
+        interval: float = 30.0,
+        max_mutations: int = 100,
+        poll_interval: float = 0.5,
+    ) -> None:
+        self.interval = interval
+        self.max_mutations = max_mutations
+        self.poll_interval = poll_interval
+        self.conflicts: list[str] = []
+        self.saves = 0
+        self._contacts = contacts
+        self._journal = journal
+        self._last_save = time.monotonic()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="autosave", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def is_due(self) -> bool:
+        if not self._contacts.is_dirty:
+            return False
+        return (
+            self._contacts.unsaved_mutations >= self.max_mutations
+            or time.monotonic() - self._last_save >= self.interval
+        )
+
+    def save(self) -> None:
+        self._last_save = time.monotonic()
+        try:
+            conflicts = self._journal.compact(self._contacts)
+        except OSError as e:
+            # The changes are still journaled, the next attempt may succeed
+            print(f"Autosave failed: {e}", file=sys.stderr)
+            return
+        self.saves += 1
+        self.conflicts.extend(name for name in conflicts if name not in self.conflicts)
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.poll_interval):
+            if self.is_due():
+                self.save()
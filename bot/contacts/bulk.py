@@ -0,0 +1,136 @@
+from array import array
+from collections.abc import Mapping
+from datetime import date
+from itertools import accumulate, chain, compress
+from operator import itemgetter
+from typing import Sequence
+
+from .models import Birthday, Name, Phone
+
+# Whole columns are checked with a few string operations over all of their
+# values at once. Only a column that fails the check is validated value by
+# value, to find the rows at fault and report them with the usual messages
+
+RowErrors = dict[int, str]  # row position -> message
+
+_day = itemgetter(slice(0, 2))
+_month = itemgetter(slice(3, 5))
+_year = itemgetter(slice(6, 10))
+
+
+def check_names(
+    names: Sequence[str], existing: Mapping[str, object], errors: RowErrors
+) -> None:
+    # Names repeated within the rows are left to check_repeated, which runs
+    # once the other columns are validated
+    unique = set(names)
+    taken = existing.keys() & unique
+    # The dot keeps a line break at the very end from being dropped
+    joined = "".join(unique) + "."
+    if not taken and "" not in unique and joined.splitlines() == [joined]:
+        return
+
+    for i, name in enumerate(names):
+        try:
+            Name(name)
+        except ValueError as e:
+            errors.setdefault(i, str(e))
+        else:
+            if name in taken:
+                errors.setdefault(i, f"Contact '{name}' already exists.")
+
+
+def check_repeated(names: Sequence[str], errors: RowErrors) -> None:
+    # A repeated name is refused only once an earlier row with that name is
+    # created, as when the rows are added one by one, and then before any
+    # other error of the row
+    if len(set(names)) == len(names):
+        return
+
+    created: set[str] = set()
+    for i, name in enumerate(names):
+        if name in created:
+            errors[i] = f"Contact '{name}' already exists."
+        elif i not in errors:
+            created.add(name)
+
+
+def parse_phones(column: Sequence[list[str]], errors: RowErrors) -> list[array]:
+    flat = list(chain.from_iterable(column))
+    counts = list(map(len, column))
+    if _are_valid_phones(flat):
+        numbers = array("Q", map(int, flat))
+        ends = list(accumulate(counts))
+        phones = list(map(numbers.__getitem__, map(slice, [0, *ends], ends)))
+    else:
+        phones = [_parse_row_phones(i, row, errors) for i, row in enumerate(column)]
+
+    # Only rows with several phones can repeat one
+    for i in compress(range(len(column)), map((1).__lt__, counts)):
+        row = column[i]
+        if len(set(row)) != len(row):
+            duplicate = next(p for p in row if row.count(p) > 1)
+            errors.setdefault(i, f"Phone number '{duplicate}' already exists")
+    return phones
+
+
+def _are_valid_phones(phones: list[str]) -> bool:
+    if not phones:
+        return True
+    digits = "".join(phones)
+    return set(map(len, phones)) == {10} and digits.isascii() and digits.isdigit()
+
+
+def _parse_row_phones(i: int, row: list[str], errors: RowErrors) -> array:
+    try:
+        return array("Q", [int(Phone(phone).value) for phone in row])
+    except ValueError as e:
+        errors.setdefault(i, str(e))
+        return array("Q")
+
+
+def parse_birthdays(column: Sequence[str | None], errors: RowErrors) -> array:
+    # Date ordinals, 0 for rows without a birthday
+    ordinals = array("l", bytes(len(column) * array("l").itemsize))
+    positions = list(compress(range(len(column)), column))
+    values: list[str] = [column[i] for i in positions]  # type: ignore[misc]
+
+    parsed = _parse_canonical_dates(values)
+    if parsed is None:
+        parsed = [_parse_birthday(i, column[i], errors) for i in positions]
+    for i, ordinal in zip(positions, parsed):
+        ordinals[i] = ordinal
+    return ordinals
+
+
+def _parse_canonical_dates(values: list[str]) -> list[int] | None:
+    # DD.MM.YYYY for every value: each one is 10 chars long with dots at the
+    # same offsets, and nothing but digits is left once the dots are removed
+    n = len(values)
+    joined = "".join(values)
+    digits = joined.replace(".", "")
+    if not (
+        len(joined) == 10 * n
+        and len(digits) == 8 * n
+        and joined[2::10] == joined[5::10] == "." * n
+        and digits.isascii()
+        and digits.isdigit()
+    ):
+        return None
+
+    days = map(int, map(_day, values))
+    months = map(int, map(_month, values))
+    years = map(int, map(_year, values))
+    try:
+        return list(map(date.toordinal, map(date, years, months, days)))
+    except ValueError:
+        # A day or month out of range, the slow path tells which rows
+        return None
+
+
+def _parse_birthday(i: int, value: str, errors: RowErrors) -> int:
+    try:
+        return Birthday(value).value.toordinal()
+    except ValueError as e:
+        errors.setdefault(i, str(e))
+        return 0
@@ -0,0 +1,65 @@
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Callable, Hashable, TypeVar
+
+if TYPE_CHECKING:
+    from .models import ContactsBook
+
+T = TypeVar("T")
+
+
+class QueryCache:
+    # Results of read-only queries, each one stamped with the book version it
+    # was computed at. Any change to the book makes every stamp stale, so
+    # nothing has to be invalidated by hand. Cached results are shared between
+    # callers and must not be changed
+    def __init__(
+        self,
+        contacts: "ContactsBook",
+        *,
+        maxsize: int = 256,
+        max_items: int = 10_000,
+    ) -> None:
+        # maxsize caps the number of results, max_items the contacts they hold
+        # all together, so a few whole-book results can't pin the book twice
+        self.maxsize = maxsize
+        self.max_items = max_items
+        self.hits = 0
+        self.misses = 0
+        self._contacts = contacts
+        self._results: OrderedDict[Hashable, tuple[Hashable, Any]] = OrderedDict()
+        self._items = 0
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+    def get(self, key: Hashable, compute: Callable[[], T]) -> T:
+        version = self._contacts.version
+        cached = self._results.get(key)
+        if cached is not None and cached[0] == version:
+            self.hits += 1
+            self._results.move_to_end(key)
+            return cached[1]
+
+        self.misses += 1
+        result = compute()
+        self._discard(key)
+        items = _count_items(result)
+        if self.maxsize > 0 and items <= self.max_items:
+            self._results[key] = (version, result)
+            self._items += items
+            while len(self._results) > self.maxsize or self._items > self.max_items:
+                self._discard(next(iter(self._results)))
+        return result
+
+    def clear(self) -> None:
+        self._results.clear()
+        self._items = 0
+
+    def _discard(self, key: Hashable) -> None:
+        cached = self._results.pop(key, None)
+        if cached is not None:
+            self._items -= _count_items(cached[1])
+
+
+def _count_items(result: Any) -> int:
+    return len(result) if isinstance(result, list) else 1
@@ -0,0 +1,75 @@
+from itertools import islice
+from typing import TYPE_CHECKING, Iterable, Iterator, Literal
+
+if TYPE_CHECKING:
+    from .models import ContactRecord, ContactsBook
+
+SortKey = Literal["none", "name", "birthday"]
+SORT_KEYS: tuple[SortKey, ...] = ("none", "name", "birthday")
+
+
+class ContactsCursor:
+    def __init__(
+        self,
+        contacts: "ContactsBook",
+        *,
+        sort: SortKey = "none",
+        name_prefix: str | None = None,
+        limit: int | None = None,
+    ) -> None:
+        if sort not in SORT_KEYS:
+            raise ValueError(f"Unknown sort key '{sort}'. Use {', '.join(SORT_KEYS)}")
+        if limit is not None and limit < 1:
+            raise ValueError("Limit must be a positive number")
+
+        self._contacts = contacts
+        self.sort = sort
+        self.name_prefix = name_prefix
+        self.limit = limit
+
+    def __iter__(self) -> Iterator["ContactRecord"]:
+        return self._records()
+
+    def page(self, number: int) -> Iterator["ContactRecord"]:
+        if number < 1:
+            raise ValueError("Page must be a positive number")
+        if self.limit is None:
+            return self._records() if number == 1 else iter(())
+
+        offset = (number - 1) * self.limit
+        return islice(self._records(), offset, offset + self.limit)
+
+    def _records(self) -> Iterator["ContactRecord"]:
+        match self.sort:
+            case "none":
+                return self._filtered(self._contacts.values())
+            case "name":
+                names = self._contacts.names_index.iter_prefixed(self.name_prefix or "")
+                return self._lookup(names)
+            case "birthday":
+                return self._filtered(self._by_birthday())
+
+    def _by_birthday(self) -> Iterator["ContactRecord"]:
+        # Contacts with birthdays in calendar order, then the rest by name
+        yield from self._lookup(self._contacts.birthdays_index.names())
+        for record in self._lookup(self._contacts.names_index.iter_prefixed()):
+            if record.birthday is None:
+                yield record
+
+    def _lookup(self, names: Iterable[str]) -> Iterator["ContactRecord"]:
+        # Records are read as the cursor goes, so on a SQLite book another
+        # connection may have deleted some of the names meanwhile
+        for name in names:
+            record = self._contacts.data.get(name)
+            if record is not None:
+                yield record
+
+    def _filtered(self, records: Iterable["ContactRecord"]) -> Iterator["ContactRecord"]:
+        if not self.name_prefix:
+            yield from records
+            return
+
+        prefix = self.name_prefix.casefold()
+        for record in records:
+            if record.name.value.casefold().startswith(prefix):
+                yield record
@@ -0,0 +1,135 @@
+import csv
+from pathlib import Path
+from typing import Iterable, Iterator, Literal, NamedTuple, TextIO
+
+from .models import ContactRecord
+
+ExchangeFormat = Literal["csv", "vcard"]
+CSV_HEADER = ["name", "phones", "birthday"]
+BUFFER_SIZE = 1024 * 1024
+
+
+class ImportReport(NamedTuple):
+    imported: int
+    errors: list[tuple[int, str]]  # row number, message
+
+
+class ContactRow(NamedTuple):
+    number: int
+    name: str
+    phones: list[str]
+    birthday: str | None
+
+
+def detect_format(path: str | Path) -> ExchangeFormat:
+    match Path(path).suffix.lower():
+        case ".csv":
+            return "csv"
+        case ".vcf" | ".vcard":
+            return "vcard"
+        case _:
+            raise ValueError("Unsupported file type. Use a .csv or .vcf file")
+
+
+def open_for_reading(path: str | Path) -> TextIO:
+    return open(path, encoding="utf-8", newline="", buffering=BUFFER_SIZE)
+
+
+def open_for_writing(path: str | Path) -> TextIO:
+    return open(path, "w", encoding="utf-8", newline="", buffering=BUFFER_SIZE)
+
+
+def read_rows(f: TextIO, format: ExchangeFormat) -> Iterator[ContactRow]:
+    return read_csv_rows(f) if format == "csv" else read_vcard_rows(f)
+
+
+def write_records(
+    f: TextIO, records: Iterable[ContactRecord], format: ExchangeFormat
+) -> int:
+    return write_csv(f, records) if format == "csv" else write_vcard(f, records)
+
+
+def read_csv_rows(f: TextIO) -> Iterator[ContactRow]:
+    reader = csv.reader(f)
+    header = next(reader, None)
+    if header is None:
+        return
+    # Files without a header row are read with the default column order
+    if [column.strip().lower() for column in header] != CSV_HEADER:
+        yield _csv_row(1, header)
+
+    for row in reader:
+        if row:
+            yield _csv_row(reader.line_num, row)
+
+
+def _csv_row(number: int, row: list[str]) -> ContactRow:
+    name, phones, birthday, *_ = row + ["", "", ""]
+    return ContactRow(
+        number=number,
+        name=name.strip(),
+        phones=[phone.strip() for phone in phones.split(";") if phone.strip()],
+        birthday=birthday.strip() or None,
+    )
+
+
+def write_csv(f: TextIO, records: Iterable[ContactRecord]) -> int:
+    writer = csv.writer(f)
+    writer.writerow(CSV_HEADER)
+    written = 0
+    for record in records:
+        writer.writerow(
+            [
+                record.name.value,
+                ";".join(phone.value for phone in record.phones),
+                record.get_birthday("%d.%m.%Y") or "",
+            ]
+        )
+        written += 1
+    return written
+
+
+def read_vcard_rows(f: TextIO) -> Iterator[ContactRow]:
+    card: ContactRow | None = None
+    for number, line in enumerate(f, start=1):
+        line = line.strip()
+        if not line:
+            continue
+
+        prop, _, value = line.partition(":")
+        # Property parameters (TEL;TYPE=CELL) don't matter for contacts
+        prop = prop.split(";", 1)[0].upper()
+        match prop:
+            case "BEGIN" if value.upper() == "VCARD":
+                card = ContactRow(number=number, name="", phones=[], birthday=None)
+            case "END" if card is not None:
+                yield card
+                card = None
+            case "FN" if card is not None:
+                card = card._replace(name=value.strip())
+            case "TEL" if card is not None:
+                card.phones.append(value.strip())
+            case "BDAY" if card is not None:
+                card = card._replace(birthday=_vcard_birthday(value.strip()))
+
+
+def _vcard_birthday(value: str) -> str:
+    # vCard dates are YYYY-MM-DD or YYYYMMDD, the bot works with DD.MM.YYYY
+    digits = value.replace("-", "")
+    if len(digits) == 8 and digits.isdigit():
+        return f"{digits[6:8]}.{digits[4:6]}.{digits[:4]}"
+    return value
+
+
+def write_vcard(f: TextIO, records: Iterable[ContactRecord]) -> int:
+    written = 0
+    for record in records:
+        lines = ["BEGIN:VCARD", "VERSION:3.0", f"FN:{record.name.value}"]
+        lines.extend(f"TEL:{phone.value}" for phone in record.phones)
+        birthday = record.get_birthday("%Y-%m-%d")
+        if birthday:
+            lines.append(f"BDAY:{birthday}")
+        lines.append("END:VCARD\n")
+        f.write("\n".join(lines))
+        written += 1
+    return written
@@ -0,0 +1,223 @@
+from bisect import bisect_left, insort
+from datetime import date
+from itertools import islice
+from typing import TYPE_CHECKING, Iterable, Iterator, Self
+
+if TYPE_CHECKING:
+    from .models import ContactRecord
+
+DayKey = tuple[int, int]  # month, day
+BirthdayKey = tuple[int, int, str]  # month, day, name
+YEAR_START: DayKey = (1, 1)
+YEAR_END: DayKey = (12, 32)
+
+
+class BirthdaysIndex:
+    def __init__(self) -> None:
+        self._keys: list[BirthdayKey] = []
+        self._by_name: dict[str, BirthdayKey] = {}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def update(self, record: "ContactRecord") -> None:
+        name = record.name.value
+        key = (
+            (record.birthday.value.month, record.birthday.value.day, name)
+            if record.birthday
+            else None
+        )
+        old_key = self._by_name.get(name)
+        if old_key == key:
+            return
+
+        if old_key:
+            self.discard(name)
+        if key:
+            insort(self._keys, key)
+            self._by_name[name] = key
+
+    def discard(self, name: str) -> None:
+        key = self._by_name.pop(name, None)
+        if key:
+            del self._keys[bisect_left(self._keys, key)]
+
+    def names(self) -> Iterator[str]:
+        return (name for _, _, name in self._keys)
+
+    def names_between(self, start: date, end: date) -> Iterator[str]:
+        return (name for _, _, name in self.keys_between(start, end))
+
+    def keys_between(self, start: date, end: date) -> Iterator[BirthdayKey]:
+        for start_key, end_key in birthday_ranges(start, end):
+            yield from self._keys_in_range(start_key, end_key)
+
+    def _keys_in_range(self, start_key: DayKey, end_key: DayKey) -> list[BirthdayKey]:
+        lo = bisect_left(self._keys, (*start_key, ""))
+        hi = bisect_left(self._keys, (*end_key, ""))
+        return self._keys[lo:hi]
+
+
+def birthday_ranges(start: date, end: date) -> list[tuple[DayKey, DayKey]]:
+    # Half-open month/day ranges covering the window, in calendar order from
+    # the start date on
+    start_key = (start.month, start.day)
+    end_key = (end.month, end.day + 1)
+    # Feb 29 birthdays are celebrated on Feb 28 in non-leap years
+    if end_key == (2, 29) and not _is_leap(end.year):
+        end_key = (2, 30)
+
+    if (end - start).days >= 365:
+        return [(start_key, YEAR_END), (YEAR_START, start_key)]
+    if start.year == end.year:
+        return [(start_key, end_key)]
+    # The window wraps around the year end
+    return [(start_key, YEAR_END), (YEAR_START, end_key)]
+
+
+def _is_leap(year: int) -> bool:
+    return year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+
+
+class PhonesIndex:
+    def __init__(self) -> None:
+        self._names_by_phone: dict[str, dict[str, None]] = {}
+        self._phones_by_name: dict[str, tuple[str, ...]] = {}
+
+    def update(self, record: "ContactRecord") -> None:
+        name = record.name.value
+        phones = tuple(p.value for p in record.phones)
+        old_phones = self._phones_by_name.get(name, ())
+        if old_phones == phones:
+            return
+
+        for phone in old_phones:
+            if phone not in phones:
+                names = self._names_by_phone[phone]
+                del names[name]
+                if not names:
+                    del self._names_by_phone[phone]
+        for phone in phones:
+            self._names_by_phone.setdefault(phone, {})[name] = None
+
+        if phones:
+            self._phones_by_name[name] = phones
+        else:
+            self._phones_by_name.pop(name, None)
+
+    def discard(self, name: str) -> None:
+        for phone in self._phones_by_name.pop(name, ()):
+            names = self._names_by_phone[phone]
+            del names[name]
+            if not names:
+                del self._names_by_phone[phone]
+
+    def find(self, phone: str) -> list[str]:
+        return list(self._names_by_phone.get(phone, ()))
+
+
+class NamesIndex:
+    # Fuzzy matches are found through prefixes and suffixes: a name within one
+    # edit of the query keeps either the first half of the query as its prefix
+    # or everything after the middle char as its suffix
+    def __init__(self) -> None:
+        self._keys: list[tuple[str, str]] = []  # folded name, name
+        self._reversed: list[tuple[str, str]] | None = None  # reversed folded name
+
+    @classmethod
+    def from_names(cls, names: Iterable[str]) -> Self:
+        index = cls()
+        index._keys = sorted((name.casefold(), name) for name in names)
+        return index
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    @property
+    def _reversed_keys(self) -> list[tuple[str, str]]:
+        # Only fuzzy queries need the suffix order, so it is built on first use
+        if self._reversed is None:
+            self._reversed = sorted(
+                (folded_name[::-1], name) for folded_name, name in self._keys
+            )
+        return self._reversed
+
+    def add(self, name: str) -> None:
+        key = (name.casefold(), name)
+        i = bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            return
+
+        self._keys.insert(i, key)
+        if self._reversed is not None:
+            insort(self._reversed, (key[0][::-1], name))
+
+    def discard(self, name: str) -> None:
+        key = (name.casefold(), name)
+        i = bisect_left(self._keys, key)
+        if i == len(self._keys) or self._keys[i] != key:
+            return
+
+        del self._keys[i]
+        if self._reversed is not None:
+            reversed_key = (key[0][::-1], name)
+            del self._reversed[bisect_left(self._reversed, reversed_key)]
+
+    def iter_prefixed(self, prefix: str = "") -> Iterator[str]:
+        return (name for _, name in _iter_prefixed(self._keys, prefix.casefold()))
+
+    def find_prefixed(self, prefix: str, limit: int) -> list[str]:
+        return list(islice(self.iter_prefixed(prefix), limit))
+
+    def find_similar(self, query: str, limit: int) -> list[str]:
+        query = query.casefold()
+        candidates: Iterable[tuple[str, str]]
+        if len(query) < 3:
+            # Short queries leave no suffix to look names up by, and their
+            # matches are short enough to pick out in one pass
+            candidates = (key for key in self._keys if len(key[0]) <= len(query) + 1)
+        else:
+            middle = len(query) // 2
+            candidates = set(_iter_prefixed(self._keys, query[:middle]))
+            candidates.update(
+                (reversed_name[::-1], name)
+                for reversed_name, name in _iter_prefixed(
+                    self._reversed_keys, query[middle + 1 :][::-1]
+                )
+            )
+
+        matches = sorted(
+            (distance, name)
+            for folded_name, name in candidates
+            if (distance := _edit_distance(query, folded_name)) <= 1
+        )
+        return [name for _, name in matches[:limit]]
+
+
+def _iter_prefixed(
+    keys: list[tuple[str, str]], prefix: str
+) -> Iterator[tuple[str, str]]:
+    for i in range(bisect_left(keys, (prefix, "")), len(keys)):
+        if not keys[i][0].startswith(prefix):
+            break
+        yield keys[i]
+
+
+def _edit_distance(a: str, b: str) -> int:
+    # Optimal string alignment distance capped at 2, so a swap of two
+    # neighbours is one edit and anything further away counts as two
+    i = 0
+    while i < len(a) and i < len(b) and a[i] == b[i]:
+        i += 1
+    if len(a) == len(b):
+        if i == len(a):
+            return 0
+        if a[i + 1 :] == b[i + 1 :]:
+            return 1
+        swapped = a[i + 1 : i + 2] == b[i : i + 1] and a[i : i + 1] == b[i + 1 : i + 2]
+        return 1 if swapped and a[i + 2 :] == b[i + 2 :] else 2
+    if len(a) == len(b) + 1:
+        return 1 if a[i + 1 :] == b[i:] else 2
+    if len(b) == len(a) + 1:
+        return 1 if b[i + 1 :] == a[i:] else 2
+    return 2
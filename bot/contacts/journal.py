@@ -0,0 +1,123 @@
+import json
+import os
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Iterator, TextIO
+
+from .locking import try_lock
+
+if TYPE_CHECKING:
+    from .models import ContactsBook
+
+
+class ContactsJournal:
+    # Every process appends to its own journal and keeps it locked while it
+    # runs, so an unlocked journal was left behind by a crashed session
+    def __init__(
+        self,
+        snapshot_path: str | Path,
+        *,
+        compaction_threshold: int = 256 * 1024,
+    ) -> None:
+        self.snapshot_path = Path(snapshot_path)
+        self.compaction_threshold = compaction_threshold
+        self._segment = 0
+        self._file: TextIO | None = None
+        self._size = 0  # bytes written to the open segment
+        self._sealed: list[TextIO] = []
+
+    @property
+    def path(self) -> Path:
+        # A new segment is started for every compaction, so entries recorded
+        # while the snapshot is being written are kept apart from older ones
+        return self.snapshot_path.with_name(
+            f"{self.snapshot_path.name}.journal.{os.getpid()}.{self._segment}"
+        )
+
+    @staticmethod
+    def find_stale(snapshot_path: str | Path) -> list[Path]:
+        snapshot_path = Path(snapshot_path)
+        stale = []
+        for path in sorted(snapshot_path.parent.glob(f"{snapshot_path.name}.journal*")):
+            try:
+                with open(path, "a") as f:
+                    if try_lock(f):
+                        stale.append(path)
+            except OSError:
+                continue
+        return stale
+
+    @staticmethod
+    def read(path: str | Path) -> Iterator[dict[str, Any]]:
+        try:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        # A torn tail left by a crash, nothing valid follows it
+                        return
+        except FileNotFoundError:
+            return
+
+    def record(self, operation: str, **params: Any) -> None:
+        # Called with the book lock held, so the segment isn't sealed meanwhile
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+            try_lock(self._file)
+        line = json.dumps({"op": operation, **params}) + "\n"
+        self._file.write(line)
+        self._file.flush()
+        self._size += len(line)  # JSON is written as ASCII
+
+    @property
+    def compaction_due(self) -> bool:
+        # Read without the book lock, so it never touches the segment file,
+        # which another thread may be sealing and closing
+        return self._size >= self.compaction_threshold
+
+    @property
+    def has_entries(self) -> bool:
+        # Segments of this session that aren't in a snapshot yet
+        return self._file is not None or bool(self._sealed)
+
+    def compact(self, contacts: "ContactsBook") -> list[str]:
+        # Saving takes the book file lock before the book lock, so this must
+        # not be called while holding the book lock, or it can deadlock with
+        # a save running on another thread
+        with contacts.lock:
+            self._seal()
+            sealed, self._sealed = self._sealed, []
+            recovered, contacts.recovered_journals = contacts.recovered_journals, []
+        try:
+            conflicts = contacts.save(self.snapshot_path)
+        except BaseException:
+            # Kept for the next compaction, nothing journaled is dropped
+            with contacts.lock:
+                self._sealed[:0] = sealed
+                contacts.recovered_journals[:0] = recovered
+            raise
+
+        # Everything journaled before sealing, including recovered journals, is
+        # now in the snapshot. Entries left by a crash right here are replayed
+        # again, and the ones that no longer apply are skipped
+        for f in sealed:
+            f.close()
+            Path(f.name).unlink(missing_ok=True)
+        for path in recovered:
+            path.unlink(missing_ok=True)
+        return conflicts
+
+    def _seal(self) -> None:
+        # Sealed segments stay open and locked until the snapshot is saved, so
+        # other sessions don't take them for ones left by a crash
+        if self._file is not None:
+            self._sealed.append(self._file)
+            self._file = None
+            self._size = 0
+            self._segment += 1
+
+    def close(self) -> None:
+        self._seal()
+        for f in self._sealed:
+            f.close()
+        self._sealed = []
@@ -0,0 +1,36 @@
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO, Any, Iterator
+
+try:
+    import fcntl
+except ImportError:  # Advisory locks are POSIX-only, elsewhere they are no-ops
+    fcntl = None  # type: ignore[assignment]
+
+
+def lock_path_for(path: str | Path) -> Path:
+    path = Path(path)
+    return path.with_name(path.name + ".lock")
+
+
+@contextmanager
+def book_lock(path: str | Path, *, shared: bool = False) -> Iterator[None]:
+    # The book itself is replaced on every save, so a sidecar file is locked
+    with open(lock_path_for(path), "a") as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def try_lock(f: IO[Any]) -> bool:
+    if not fcntl:
+        return True
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
@@ -0,0 +1,361 @@
+import heapq
+import mmap
+import os
+import pickle
+import struct
+import weakref
+from collections.abc import MutableMapping
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, BinaryIO, Iterator
+
+from .storage import CODECS, Codec
+from .views import RecordsViews
+
+if TYPE_CHECKING:
+    from .models import ContactRecord, ContactsBook
+
+# File layout: header | record blobs | names | index (sorted by name)
+MAGIC = b"CBOOKMAP"
+VERSION = 1
+HEADER = struct.Struct("<8sIQQQ")  # magic, version, count, generation, index_offset
+INDEX_ENTRY = struct.Struct("<QIQI")  # name_offset, name_len, blob_offset, blob_len
+
+# Compressed layout: header | the file above through the codec, with its header
+# moved to the end, as it is only known once everything else is written
+COMPRESSED_MAGIC = b"CBOOKZIP"
+COMPRESSED_HEADER = struct.Struct("<8sIQ")  # magic, codec, generation
+CHUNK_SIZE = 1 << 20
+
+
+def is_mapped_file(path: str | Path) -> bool:
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) in (MAGIC, COMPRESSED_MAGIC)
+    except (FileNotFoundError, IsADirectoryError):
+        return False
+
+
+def read_generation(path: str | Path) -> int:
+    # Bumped on every save, a mismatch means another session saved in between
+    try:
+        with open(path, "rb") as f:
+            header = f.read(HEADER.size)
+    except FileNotFoundError:
+        return 0
+    if header.startswith(COMPRESSED_MAGIC) and len(header) >= COMPRESSED_HEADER.size:
+        return COMPRESSED_HEADER.unpack_from(header)[2]
+    if len(header) < HEADER.size or not header.startswith(MAGIC):
+        return 0
+    return HEADER.unpack(header)[3]
+
+
+class MappedRecords(RecordsViews, MutableMapping):
+    # Compressed files can't be mapped, they are decompressed into memory and
+    # read the same way
+    def __init__(self, path: str | Path, owner: "ContactsBook") -> None:
+        self.codec: Codec = "none"
+        self._mm: mmap.mmap | bytearray
+        with open(path, "rb") as f:
+            header = f.read(COMPRESSED_HEADER.size)
+            if header.startswith(COMPRESSED_MAGIC):
+                self.codec = _read_codec(header, path)
+                self._mm = _decompress(f, self.codec, path)
+            else:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, count, generation, index_offset = HEADER.unpack_from(
+            self._mm, 0
+        )
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Unsupported contacts book format: '{path}'")
+
+        self.generation = generation
+        self._owner = owner
+        self._count = count
+        self._index_offset = index_offset
+        # Decoded records stay shared while somebody holds them, changed and new
+        # ones are pinned in the overlay until the next save
+        self._cache: weakref.WeakValueDictionary[str, ContactRecord] = (
+            weakref.WeakValueDictionary()
+        )
+        self._overlay: dict[str, ContactRecord] = {}
+        self._new: dict[str, None] = {}
+        self._deleted: set[str] = set()
+
+    def _entry(self, i: int) -> tuple[int, int, int, int]:
+        return INDEX_ENTRY.unpack_from(
+            self._mm, self._index_offset + i * INDEX_ENTRY.size
+        )
+
+    def _name_at(self, i: int) -> bytes:
+        name_offset, name_len, _, _ = self._entry(i)
+        return self._mm[name_offset : name_offset + name_len]
+
+    def _blob_at(self, i: int) -> bytes:
+        _, _, blob_offset, blob_len = self._entry(i)
+        return self._mm[blob_offset : blob_offset + blob_len]
+
+    def _search(self, name: str) -> int | None:
+        key = name.encode()
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            mid_name = self._name_at(mid)
+            if mid_name < key:
+                lo = mid + 1
+            elif mid_name > key:
+                hi = mid
+            else:
+                return mid
+        return None
+
+    def _decode(self, i: int, name: str) -> "ContactRecord":
+        record = self._cache.get(name)
+        if record is None:
+            record = pickle.loads(self._blob_at(i))
+            record._book = self._owner
+            self._cache[name] = record
+        return record
+
+    def load_saved(self, name: str) -> "ContactRecord | None":
+        # The record as it is in the file, ignoring changes made since loading
+        i = self._search(name)
+        return pickle.loads(self._blob_at(i)) if i is not None else None
+
+    def __getitem__(self, name: str) -> "ContactRecord":
+        if name in self._overlay:
+            return self._overlay[name]
+        if name in self._deleted:
+            raise KeyError(name)
+
+        i = self._search(name)
+        if i is None:
+            raise KeyError(name)
+        return self._decode(i, name)
+
+    def __setitem__(self, name: str, record: "ContactRecord") -> None:
+        if name not in self._overlay and name not in self._deleted:
+            if self._search(name) is None:
+                self._new[name] = None
+        self._deleted.discard(name)
+        self._overlay[name] = record
+
+    def __delitem__(self, name: str) -> None:
+        if name not in self:
+            raise KeyError(name)
+
+        self._overlay.pop(name, None)
+        self._cache.pop(name, None)
+        if name in self._new:
+            del self._new[name]
+        else:
+            self._deleted.add(name)
+
+    def __contains__(self, name: object) -> bool:
+        if not isinstance(name, str) or name in self._deleted:
+            return False
+        return name in self._overlay or self._search(name) is not None
+
+    def __len__(self) -> int:
+        return self._count - len(self._deleted) + len(self._new)
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(self._count):
+            name = self._name_at(i).decode()
+            if name not in self._deleted:
+                yield name
+        yield from list(self._new)
+
+    def iter_records(self) -> Iterator["ContactRecord"]:
+        for i in range(self._count):
+            name = self._name_at(i).decode()
+            if name in self._deleted:
+                continue
+            if name in self._overlay:
+                yield self._overlay[name]
+            else:
+                yield self._decode(i, name)
+        for name in list(self._new):
+            yield self._overlay[name]
+
+    def snapshot_blobs(self) -> Iterator[tuple[str, bytes]]:
+        # Changed records are encoded right away, the rest is copied from the
+        # mapped file later, so the result can be written while the book changes
+        overlay = {
+            name: encode_record(record) for name, record in self._overlay.items()
+        }
+        return self.merged_blobs(overlay, set(self._deleted))
+
+    def merged_blobs(
+        self, overlay: dict[str, bytes], deleted: set[str]
+    ) -> Iterator[tuple[str, bytes]]:
+        # The saved blobs with encoded changes applied, in file order
+        changed = sorted(overlay.items(), key=lambda item: item[0].encode())
+        return heapq.merge(
+            self._iter_mapped_blobs(deleted | overlay.keys()),
+            changed,
+            key=lambda item: item[0].encode(),
+        )
+
+    def is_saved(self, name: str) -> bool:
+        # Still as it is in the file, neither changed nor deleted since loading
+        return name not in self._overlay and name not in self._deleted
+
+    def saved_blobs(self) -> Iterator[tuple[str, bytes]]:
+        # The file never changes once mapped, so it can be read without the
+        # book lock while the book keeps changing
+        return self._iter_mapped_blobs(set())
+
+    def _iter_mapped_blobs(self, skipped: set[str]) -> Iterator[tuple[str, bytes]]:
+        # Unchanged records are copied as raw bytes without being decoded
+        for i in range(self._count):
+            name = self._name_at(i).decode()
+            if name not in skipped:
+                yield name, self._blob_at(i)
+
+
+def encode_record(record: "ContactRecord") -> bytes:
+    return pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def snapshot_blobs(contacts: "ContactsBook") -> Iterator[tuple[str, bytes]]:
+    # Mapped and sharded records copy the saved blobs as they are
+    if hasattr(contacts.data, "snapshot_blobs"):
+        return contacts.data.snapshot_blobs()
+    names = sorted(contacts.data, key=str.encode)
+    return iter([(name, encode_record(contacts.data[name])) for name in names])
+
+
+def write_mapped(
+    blobs: Iterator[tuple[str, bytes]],
+    generation: int,
+    path: str | Path,
+    *,
+    codec: Codec = "none",
+) -> None:
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+
+    # Write next to the target and rename, as the old file may still be mapped
+    with open(tmp_path, "wb") as f:
+        if codec == "none":
+            header = _write_image(f, blobs, generation)
+            f.seek(0)
+            f.write(header)
+        else:
+            f.write(
+                COMPRESSED_HEADER.pack(
+                    COMPRESSED_MAGIC, CODECS.index(codec), generation
+                )
+            )
+            # Streamed through the compressor, the file is never held whole
+            stream = _CompressedStream(f, _compressor(codec))
+            stream.write(_write_image(stream, blobs, generation))
+            stream.close()
+    os.replace(tmp_path, path)
+
+
+def _write_image(
+    f: "BinaryIO | _CompressedStream",
+    blobs: Iterator[tuple[str, bytes]],
+    generation: int,
+) -> bytes:
+    # Everything but the header, which is returned to be written last
+    f.write(b"\0" * HEADER.size)
+    entries = _write_blobs(f, blobs)
+    index = bytearray()
+    for name_bytes, blob_offset, blob_len in entries:
+        index += INDEX_ENTRY.pack(f.tell(), len(name_bytes), blob_offset, blob_len)
+        f.write(name_bytes)
+    index_offset = f.tell()
+    f.write(index)
+    return HEADER.pack(MAGIC, VERSION, len(entries), generation, index_offset)
+
+
+def _write_blobs(
+    f: "BinaryIO | _CompressedStream", blobs: Iterator[tuple[str, bytes]]
+) -> list[tuple[bytes, int, int]]:
+    entries = []
+    for name, blob in blobs:
+        entries.append((name.encode(), f.tell(), len(blob)))
+        f.write(blob)
+    return entries
+
+
+class _CompressedStream:
+    # Compresses what is written in chunks, tell() counts uncompressed bytes
+    def __init__(self, f: BinaryIO, compressor: Any) -> None:
+        self._f = f
+        self._compressor = compressor
+        self._buffer = bytearray()
+        self._offset = 0
+
+    def tell(self) -> int:
+        return self._offset
+
+    def write(self, data: bytes) -> None:
+        self._buffer += data
+        self._offset += len(data)
+        if len(self._buffer) >= CHUNK_SIZE:
+            self._f.write(self._compressor.compress(self._buffer))
+            self._buffer.clear()
+
+    def close(self) -> None:
+        self._f.write(self._compressor.compress(self._buffer))
+        self._f.write(self._compressor.flush())
+
+
+def _compressor(codec: Codec) -> Any:
+    # Imported here, so books saved without compression don't pay for it
+    if codec == "zlib":
+        import zlib
+
+        return zlib.compressobj()
+    if codec == "bz2":
+        import bz2
+
+        return bz2.BZ2Compressor()
+    import lzma
+
+    return lzma.LZMACompressor()
+
+
+def _decompressor(codec: Codec) -> Any:
+    if codec == "zlib":
+        import zlib
+
+        return zlib.decompressobj()
+    if codec == "bz2":
+        import bz2
+
+        return bz2.BZ2Decompressor()
+    import lzma
+
+    return lzma.LZMADecompressor()
+
+
+def _read_codec(header: bytes, path: str | Path) -> Codec:
+    if len(header) == COMPRESSED_HEADER.size:
+        codec_id = COMPRESSED_HEADER.unpack(header)[1]
+        if 0 < codec_id < len(CODECS):
+            return CODECS[codec_id]
+    raise ValueError(f"Unsupported contacts book format: '{path}'")
+
+
+def _decompress(f: BinaryIO, codec: Codec, path: str | Path) -> bytearray:
+    decompressor = _decompressor(codec)
+    image = bytearray()
+    try:
+        while chunk := f.read(CHUNK_SIZE):
+            image += decompressor.decompress(chunk)
+    except Exception as e:
+        # Each codec has its own errors for corrupted data
+        raise ValueError(f"Corrupted contacts book: '{path}'") from e
+    if not decompressor.eof or len(image) < HEADER.size:
+        # Cut short
+        raise ValueError(f"Corrupted contacts book: '{path}'")
+
+    # The header was written last, it goes back in front of the blobs
+    image[: HEADER.size] = image[-HEADER.size :]
+    del image[-HEADER.size :]
+    return image
@@ -1,167 +1,775 @@
 import pickle
+import threading
+import weakref
+from array import array
 from collections import UserDict
+from collections.abc import ItemsView, ValuesView
+from contextlib import contextmanager
 from datetime import date, datetime, timedelta
+from functools import partial
 from pathlib import Path
-from typing import Any, Self
+from typing import Any, Hashable, Iterable, Iterator, Self
+
+from .cursor import ContactsCursor, SortKey
+from .indexes import BirthdaysIndex, NamesIndex, PhonesIndex
+from .journal import ContactsJournal
+from .locking import book_lock
+from .mapped import (
+    MappedRecords,
+    is_mapped_file,
+    read_generation,
+    snapshot_blobs,
+    write_mapped,
+)
+from .sharded import (
+    ShardedRecords,
+    is_sharded_dir,
+    read_sharded_generation,
+    snapshot_shards,
+    write_sharded,
+)
+from .snapshot import SnapshotRecords
+from .sqlite import (
+    SqliteBirthdaysIndex,
+    SqlitePhonesIndex,
+    SqliteRecords,
+    write_sqlite,
+)
+from .storage import Codec, StorageBackend, detect_backend
 
 
 class Field:
+    __slots__ = ("value",)
+
     def __init__(self, value: Any) -> None:
         self.value = value
 
+    @classmethod
+    def _trusted(cls, value: Any) -> Self:
+        # Wraps an already validated value without running the checks again
+        field = cls.__new__(cls)
+        field.value = value
+        return field
+
+    def __getstate__(self) -> Any:
+        return self.value
+
+    def __setstate__(self, state: Any) -> None:
+        # Fields pickled before __slots__ carry their attributes in a dict
+        self.value = state["value"] if isinstance(state, dict) else state
+
     def __str__(self):
         return str(self.value)
 
 
 class Name(Field):
+    __slots__ = ()
+
     def __init__(self, value: str) -> None:
         # Name validation
         if not value:
             raise ValueError("Name cannot be empty")
+        if value.splitlines() != [value]:
+            # Output is line based, e.g. one response per line on the server
+            raise ValueError("Name cannot contain line breaks")
 
         super().__init__(value)
 
 
 class Phone(Field):
+    __slots__ = ()
+
     def __init__(self, value: str) -> None:
         # Phone number validation
         if not value:
             raise ValueError("Phone number cannot be empty")
         if len(value) != 10:
             raise ValueError("Phone number must be exactly 10 digits")
-        if not value.isdigit():
+        if not (value.isascii() and value.isdigit()):
             raise ValueError("Phone number must contain only digits")
 
         super().__init__(value)
 
 
 class Birthday(Field):
+    __slots__ = ()
+
     def __init__(self, value: str) -> None:
         try:
-            value = datetime.strptime(value, "%d.%m.%Y")
-            super().__init__(value)
+            super().__init__(self._parse(value))
         except ValueError:
             raise ValueError("Invalid birthday format. Use DD.MM.YYYY")
 
+    @staticmethod
+    def _parse(value: str) -> datetime:
+        # strptime is slow, so the canonical DD.MM.YYYY shape is parsed by hand
+        if (
+            len(value) == 10
+            and value[2] == "."
+            and value[5] == "."
+            and value.isascii()
+            and (digits := value[:2] + value[3:5] + value[6:]).isdigit()
+        ):
+            return datetime(int(digits[4:]), int(digits[2:4]), int(digits[:2]))
+        return datetime.strptime(value, "%d.%m.%Y")
+
 
 class ContactRecord:
+    # Fields are kept compact and wrapped into Name/Phone/Birthday on access:
+    # phones are packed 10-digit integers, the birthday is a date ordinal
+    __slots__ = ("_name", "_phones", "_birthday", "_book", "__weakref__")
+
     def __init__(self, name: str) -> None:
-        self.name = Name(name)
-        self.phones: list[Phone] = []
-        self.birthday = None
+        self._name: str = Name(name).value
+        self._phones = array("Q")
+        self._birthday = 0
+        self._book: ContactsBook | None = None
+
+    @classmethod
+    def _trusted(cls, name: str, phones: array, birthday: int) -> Self:
+        # Builds a record from already validated values, as bulk creation does
+        record = cls.__new__(cls)
+        record._name = name
+        record._phones = phones
+        record._birthday = birthday
+        record._book = None
+        return record
+
+    def __getstate__(self) -> tuple[str, bytes, int]:
+        # The owning book is restored by whoever loads the record
+        return self._name, self._phones.tobytes(), self._birthday
+
+    def __setstate__(self, state: tuple[str, bytes, int] | dict[str, Any]) -> None:
+        self._phones = array("Q")
+        self._book = None
+        if isinstance(state, dict):
+            # Records pickled before the compact layout
+            self._name = state["name"].value
+            self._phones.extend(int(p.value) for p in state["phones"])
+            birthday = state.get("birthday")
+            self._birthday = birthday.value.toordinal() if birthday else 0
+        else:
+            self._name, phones, self._birthday = state
+            self._phones.frombytes(phones)
+
+    def _restore(self, state: tuple[str, bytes, int]) -> None:
+        # Puts back a state taken by __getstate__, undoing the changes since
+        self._changing()
+        book = self._book
+        self.__setstate__(state)
+        self._book = book
+        self._changed()
+
+    @property
+    def name(self) -> Name:
+        return Name._trusted(self._name)
+
+    @property
+    def phones(self) -> tuple[Phone, ...]:
+        # A fresh copy of the packed phones, so changes go through add_phone,
+        # edit_phone and remove_phone
+        return tuple(Phone._trusted(f"{phone:010d}") for phone in self._phones)
+
+    @property
+    def birthday(self) -> Birthday | None:
+        if not self._birthday:
+            return None
+        return Birthday._trusted(datetime.fromordinal(self._birthday))
+
+    def _changing(self) -> None:
+        # Right before a change, so snapshots of the book keep the old state
+        if self._book is not None and self._book._snapshots:
+            self._book._preserve(self._name)
+
+    def _changed(self) -> None:
+        if self._book is not None:
+            self._book._record_changed(self)
+
+    def _check_phone_owner(self, phone: str) -> None:
+        if self._book is not None:
+            self._book._check_phone_owner(self, phone)
 
     def add_phone(self, phone: str) -> None:
         phone_idx = self._find_phone_index(phone)
         if phone_idx is not None:
             raise ValueError(f"Phone number '{phone}' already exists")
 
-        self.phones.append(Phone(phone))
+        new_phone = Phone(phone)
+        self._check_phone_owner(phone)
+        self._changing()
+        self._phones.append(int(new_phone.value))
+        self._changed()
 
     def remove_phone(self, phone: str) -> None:
         phone_idx = self._find_phone_index(phone)
         if phone_idx is None:
             raise ValueError(f"Phone number '{phone}' does not exist")
 
-        del self.phones[phone_idx]
+        self._changing()
+        del self._phones[phone_idx]
+        self._changed()
 
     def edit_phone(self, old_phone: str, new_phone: str) -> None:
         phone_idx = self._find_phone_index(old_phone)
         if phone_idx is None:
             raise ValueError(f"Phone number '{old_phone}' does not exist")
 
-        self.phones[phone_idx] = Phone(new_phone)
+        phone = Phone(new_phone)
+        self._check_phone_owner(new_phone)
+        self._changing()
+        self._phones[phone_idx] = int(phone.value)
+        self._changed()
 
     def replace_phone(self, phone_index: int, new_phone: str) -> None:
-        if phone_index > len(self.phones) - 1:
+        if phone_index > len(self._phones) - 1:
             raise ValueError(f"Phone number at position {phone_index} does not exist")
 
-        self.phones[phone_index] = Phone(new_phone)
+        phone = Phone(new_phone)
+        self._check_phone_owner(new_phone)
+        self._changing()
+        self._phones[phone_index] = int(phone.value)
+        self._changed()
 
     def find_phone(self, phone: str) -> Phone | None:
-        for p in self.phones:
-            if p.value == phone:
-                return p
+        phone_idx = self._find_phone_index(phone)
+        return Phone._trusted(phone) if phone_idx is not None else None
 
     def _find_phone_index(self, phone: str) -> int | None:
-        for i, p in enumerate(self.phones):
-            if p.value == phone:
-                return i
+        if len(phone) != 10 or not (phone.isascii() and phone.isdigit()):
+            return None
+        try:
+            return self._phones.index(int(phone))
+        except ValueError:
+            return None
 
     def add_birthday(self, birthday: str) -> None:
-        self.birthday = Birthday(birthday)
+        birthday_ordinal = Birthday(birthday).value.toordinal()
+        self._changing()
+        self._birthday = birthday_ordinal
+        self._changed()
 
     def get_birthday(self, format: str = "%Y.%m.%d") -> str | None:
-        return self.birthday.value.strftime(format) if self.birthday else None
+        birthday = self.birthday
+        return birthday.value.strftime(format) if birthday else None
 
     def __str__(self):
-        return f"Contact name: {self.name.value}, phones: {'; '.join(p.value for p in self.phones)}"
+        return f"Contact name: {self._name}, phones: {'; '.join(p.value for p in self.phones)}"
+
+
+def next_birthday_date(month: int, day: int, current_date: date) -> date:
+    next_birthday = _birthday_in_year(current_date.year, month, day)
+    if next_birthday < current_date:
+        next_birthday = _birthday_in_year(current_date.year + 1, month, day)
+    return next_birthday
+
+
+def congratulation_date(
+    month: int, day: int, current_date: date, days: int
+) -> str | None:
+    next_birthday = next_birthday_date(month, day, current_date)
+    if (next_birthday - current_date).days > days:
+        return None
+
+    if next_birthday.isoweekday() == 6:  # Saturday -> Monday
+        next_birthday += timedelta(days=2)
+    elif next_birthday.isoweekday() == 7:  # Sunday -> Monday
+        next_birthday += timedelta(days=1)
+    return next_birthday.strftime("%Y.%m.%d")
+
+
+def _birthday_in_year(year: int, month: int, day: int) -> date:
+    try:
+        return date(year, month, day)
+    except ValueError:
+        # Feb 29 birthdays are celebrated on Feb 28 in non-leap years
+        return date(year, 2, 28)
+
+
+# Every birthday comes round within this many days, longer windows show nothing
+# more and could overflow the date range
+MAX_UPCOMING_DAYS = 366
 
 
 class ContactsBook(UserDict):
+    unique_phones: bool = False
+    # Mapped books are saved with it, loading takes it from the file
+    codec: Codec = "none"
+    # Set on loading, so saves keep the book in the backend it was opened with
+    # whatever the path looks like. Books built in memory go by the path
+    save_backend: StorageBackend | None = None
+    _birthdays_index: BirthdaysIndex | None = None
+    _phones_index: PhonesIndex | None = None
+    _names_index: NamesIndex | None = None
+    _names_index_version: int | None = None  # SQLite data version it was built at
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        self._init_session()
+        super().__init__(*args, **kwargs)
+
+    def _init_session(self) -> None:
+        # Generation of the saved book this one is based on
+        self.generation = 0
+        self.recovered_journals: list[Path] = []
+        # Names added, changed or deleted since the last load or save
+        self._changed_names: set[str] = set()
+        self._deleted_names: set[str] = set()
+        # Bumped by every change to the records: compared with its value at the
+        # last save, and used as the generation of cached query results
+        self.mutations = 0
+        self.saved_mutations = 0
+        # Held by whoever reads or changes the book while it may be saved from
+        # another thread
+        self.lock = threading.RLock()
+        # Records of the snapshots taken from this book that are still in use
+        self._snapshots: weakref.WeakValueDictionary[int, SnapshotRecords] = (
+            weakref.WeakValueDictionary()
+        )
+
+    def __getstate__(self) -> dict[str, Any]:
+        # Only the records are persisted, the rest is rebuilt after loading
+        return {"data": self.data}
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self._init_session()
+        self.data = state["data"]
+        for record in self.data.values():
+            record._book = self
+
+    def values(self) -> ValuesView[ContactRecord]:
+        return self.data.values()
+
+    def items(self) -> ItemsView[str, ContactRecord]:
+        return self.data.items()
+
     def add_record(self, record: ContactRecord) -> None:
-        self.data[record.name.value] = record
+        if self.unique_phones:
+            for phone in record.phones:
+                self._check_phone_owner(record, phone.value)
+
+        name = record.name.value
+        if self._snapshots:
+            self._preserve(name)
+        record._book = self
+        self.data[name] = record
+        self._changed_names.add(name)
+        self._deleted_names.discard(name)
+        self.mutations += 1
+        self._update_indexes(record)
+        if self._names_index is not None:
+            self._names_index.add(name)
+
+    def add_records(self, records: list[ContactRecord]) -> None:
+        # Adds validated records in one pass, names must not be taken yet
+        if self.unique_phones:
+            for record in records:
+                self.add_record(record)
+            return
+
+        names = [record._name for record in records]
+        if self._snapshots:
+            for name in names:
+                self._preserve(name)
+        for record in records:
+            record._book = self
+        with self.batch():
+            self.data.update(zip(names, records))
+        self._changed_names.update(names)
+        self._deleted_names.difference_update(names)
+        self.mutations += len(records)
+        if self._birthdays_index is not None or self._phones_index is not None:
+            for record in records:
+                self._update_indexes(record)
+        if self._names_index is not None:
+            for name in names:
+                self._names_index.add(name)
+
+    def _record_changed(self, record: ContactRecord) -> None:
+        # Pins records decoded from a mapped file, so their changes get saved
+        name = record.name.value
+        self.data[name] = record
+        self._changed_names.add(name)
+        self.mutations += 1
+        self._update_indexes(record)
+
+    def snapshot(self) -> Self:
+        # A read-only book with the records as they are now. Taking it copies
+        # nothing, and it can be read from another thread while this book
+        # keeps changing: only the records changed meanwhile are copied
+        snapshot = type(self)()
+        with self.lock:
+            records = SnapshotRecords(self.data, self.lock)
+            self._snapshots[id(records)] = records
+            snapshot.mutations = self.mutations
+        snapshot.data = records
+        return snapshot
+
+    def _preserve(self, name: str) -> None:
+        # Copy on write: snapshots keep the record as it is before a change
+        for records in self._snapshots.values():
+            records.preserve(name)
+
+    @property
+    def is_dirty(self) -> bool:
+        return bool(self._changed_names or self._deleted_names)
+
+    @property
+    def unsaved_mutations(self) -> int:
+        return self.mutations - self.saved_mutations
+
+    @property
+    def version(self) -> Hashable:
+        # Changes whenever the records may have: with every change made here,
+        # and for SQLite books with every commit by another connection too
+        if isinstance(self.data, SqliteRecords):
+            return self.mutations, self.data.data_version()
+        return self.mutations
+
+    @property
+    def backend(self) -> StorageBackend:
+        if isinstance(self.data, SqliteRecords):
+            return "sqlite"
+        if isinstance(self.data, ShardedRecords):
+            return "sharded"
+        return "mapped"
+
+    def _update_indexes(self, record: ContactRecord) -> None:
+        if self._birthdays_index is not None:
+            self._birthdays_index.update(record)
+        if self._phones_index is not None:
+            self._phones_index.update(record)
+
+    def _check_phone_owner(self, record: ContactRecord, phone: str) -> None:
+        if not self.unique_phones:
+            return
+
+        for owner in self.phones_index.find(phone):
+            if owner != record.name.value:
+                raise ValueError(f"Phone number '{phone}' already belongs to {owner}")
 
     def find(self, name: str) -> ContactRecord | None:
         return self.data.get(name)
 
     def delete(self, name: str) -> None:
-        del self.data[name]
+        if self._snapshots:
+            self._preserve(name)
+        record = self.data.pop(name)
+        record._book = None
+        self._changed_names.discard(name)
+        self._deleted_names.add(name)
+        self.mutations += 1
+        if self._birthdays_index is not None:
+            self._birthdays_index.discard(name)
+        if self._phones_index is not None:
+            self._phones_index.discard(name)
+        if self._names_index is not None:
+            self._names_index.discard(name)
 
     @property
-    def birthdays_count(self) -> int:
-        return sum(1 for record in self.data.values() if record.birthday)
+    def phones_index(self) -> PhonesIndex | SqlitePhonesIndex:
+        if isinstance(self.data, SqliteRecords):
+            return self.data.phones_index
+        if self._phones_index is None:
+            self._phones_index = PhonesIndex()
+            for record in self.data.values():
+                self._phones_index.update(record)
+        return self._phones_index
+
+    def find_by_phone(self, phone: str) -> list[ContactRecord]:
+        return [self.data[name] for name in self.phones_index.find(phone)]
+
+    def cursor(
+        self,
+        *,
+        sort: SortKey = "none",
+        name_prefix: str | None = None,
+        limit: int | None = None,
+    ) -> ContactsCursor:
+        return ContactsCursor(self, sort=sort, name_prefix=name_prefix, limit=limit)
 
-    def get_upcoming_birthdays(self) -> list[dict]:
-        current_date = date.today()
-        upcoming_birthdays: list[dict] = []
+    @property
+    def names_index(self) -> NamesIndex:
+        if isinstance(self.data, SqliteRecords):
+            # Built again once another connection has committed, it may have
+            # added or deleted names
+            version = self.data.data_version()
+            if version != self._names_index_version:
+                self._names_index = None
+                self._names_index_version = version
+        if self._names_index is None:
+            self._names_index = NamesIndex.from_names(self.data)
+        return self._names_index
+
+    def search(self, query: str, *, limit: int = 10) -> list[ContactRecord]:
+        # Names starting with the query go first, then the ones within one typo
+        names = self.names_index.find_prefixed(query, limit)
+        for name in self.names_index.find_similar(query, limit):
+            if len(names) == limit:
+                break
+            if name not in names:
+                names.append(name)
+        return [self.data[name] for name in names]
 
-        for record in self.data.values():
-            if record.birthday is None:
-                continue
+    @property
+    def birthdays_index(self) -> BirthdaysIndex | SqliteBirthdaysIndex:
+        if isinstance(self.data, SqliteRecords):
+            return self.data.birthdays_index
+        # Built on first use, so mapped books don't decode every record upfront
+        if self._birthdays_index is None:
+            self._birthdays_index = BirthdaysIndex()
+            for record in self.data.values():
+                self._birthdays_index.update(record)
+        return self._birthdays_index
 
-            current_year_birthday = date(
-                year=current_date.year,
-                month=record.birthday.value.month,
-                day=record.birthday.value.day,
-            )
+    @property
+    def birthdays_count(self) -> int:
+        return len(self.birthdays_index)
 
-            if current_year_birthday >= current_date:
-                next_birthday = current_year_birthday
-            else:
-                next_birthday = date(
-                    year=current_date.year + 1,
-                    month=record.birthday.value.month,
-                    day=record.birthday.value.day,
-                )
+    def get_upcoming_birthdays(self, days: int = 7) -> list[dict]:
+        current_date = date.today()
+        upcoming_birthdays: list[dict] = []
 
-            dates_diff = next_birthday - current_date
-            if dates_diff.days > 7:
+        # Contacts come grouped by birthday, so the congratulation date is only
+        # worked out once for each calendar day in the window, and each birth
+        # date is only formatted once
+        dates: dict[tuple[int, int], str | None] = {}
+        birthdays: dict[int, str] = {}
+        days = min(days, MAX_UPCOMING_DAYS)
+        window_end = current_date + timedelta(days=days)
+        for month, day, name in self.birthdays_index.keys_between(
+            current_date, window_end
+        ):
+            if (month, day) not in dates:
+                dates[month, day] = congratulation_date(month, day, current_date, days)
+            date_text = dates[month, day]
+            if date_text is None:
                 continue
 
-            congratulation_date = next_birthday
-            if congratulation_date.isoweekday() == 6:  # Saturday -> Monday
-                congratulation_date += timedelta(days=2)
-            elif congratulation_date.isoweekday() == 7:  # Sunday -> Monday
-                congratulation_date += timedelta(days=1)
-
+            record = self.data[name]
+            birthday = birthdays.get(record._birthday)
+            if birthday is None:
+                birthday = date.fromordinal(record._birthday).strftime("%Y.%m.%d")
+                birthdays[record._birthday] = birthday
             upcoming_birthdays.append(
                 {
                     "name": record.name,
-                    "birthday": record.get_birthday(),
-                    "congratulation_date": congratulation_date.strftime("%Y.%m.%d"),
+                    "birthday": birthday,
+                    "congratulation_date": date_text,
                 }
             )
 
         return upcoming_birthdays
 
     @classmethod
-    def from_file(cls, path: str | Path) -> Self:
-        try:
-            with open(path, "rb") as f:
-                return pickle.load(f)
-        except FileNotFoundError:
-            return cls()
-
-    def save(self, path: str | Path) -> None:
-        with open(path, "wb") as f:
-            pickle.dump(self, f)
+    def from_file(
+        cls,
+        path: str | Path,
+        *,
+        backend: StorageBackend | None = None,
+        codec: Codec | None = None,
+    ) -> Self:
+        backend = backend or detect_backend(path)
+        if codec not in (None, "none") and backend != "mapped":
+            raise ValueError(f"Only mapped books can be compressed, not {backend}")
+        if backend == "sqlite":
+            # Every change is committed right away, so no journal is involved
+            contacts = cls()
+            contacts.data = SqliteRecords(path, owner=contacts)
+            contacts.save_backend = backend
+            return contacts
+
+        with book_lock(path, shared=True):
+            if backend == "sharded":
+                # Shards are only mapped here, records are decoded on access
+                contacts = cls()
+                contacts.data = ShardedRecords(path, owner=contacts)
+                contacts.generation = contacts.data.generation
+            elif is_mapped_file(path):
+                contacts = cls()
+                contacts.data = MappedRecords(path, owner=contacts)
+                contacts.generation = contacts.data.generation
+                contacts.codec = contacts.data.codec
+            else:
+                # Legacy pickle books are migrated to the mapped format on save
+                try:
+                    with open(path, "rb") as f:
+                        contacts = pickle.load(f)
+                except FileNotFoundError:
+                    contacts = cls()
+        contacts.save_backend = backend
+        if codec is not None:
+            # Takes effect on the next save
+            contacts.codec = codec
+
+        # Changes journaled by sessions that crashed before saving them
+        contacts.recovered_journals = ContactsJournal.find_stale(path)
+        for journal_path in contacts.recovered_journals:
+            contacts.replay_journal(ContactsJournal.read(journal_path))
+        return contacts
+
+    def replay_journal(self, entries: Iterable[dict[str, Any]]) -> None:
+        for entry in entries:
+            if entry["op"] == "batch":
+                # A committed transaction, journaled as a single line
+                self.replay_journal(entry["entries"])
+                continue
+
+            name = entry["name"]
+            # Entries may already be part of the snapshot, the ones that no
+            # longer apply are skipped
+            try:
+                match entry["op"]:
+                    case "create" if name not in self.data:
+                        record = ContactRecord(name)
+                        if entry.get("phone"):
+                            record.add_phone(entry["phone"])
+                        if entry.get("birthday"):
+                            record.add_birthday(entry["birthday"])
+                        self.add_record(record)
+                    case "add_phone":
+                        self.data[name].add_phone(entry["phone"])
+                    case "add_birthday":
+                        self.data[name].add_birthday(entry["birthday"])
+                    case "update":
+                        if entry.get("phone"):
+                            self.data[name].edit_phone(*entry["phone"])
+                        if entry.get("birthday"):
+                            self.data[name].add_birthday(entry["birthday"])
+            except (KeyError, ValueError):
+                continue
+
+    def save(self, path: str | Path) -> list[str]:
+        backend = self.save_backend or detect_backend(path)
+        if backend == "sqlite":
+            self._save_sqlite(path)
+            return []
+
+        # A new sharded book gets its directory on the first save
+        sharded = backend == "sharded"
+        write = write_sharded if sharded else partial(write_mapped, codec=self.codec)
+        with book_lock(path):
+            # Saved books are opened before taking the book lock: a compressed
+            # one is decompressed whole, and commands shouldn't wait for that
+            saved_generation = (
+                read_sharded_generation(path) if sharded else read_generation(path)
+            )
+            saved = None
+            if saved_generation != self.generation:
+                saved = _open_saved(path, owner=self)
+            with self.lock:
+                conflicts = []
+                if saved is not None:
+                    conflicts = self._merge_saved(saved)
+
+                generation = saved_generation + 1
+                mutations = self.mutations
+                changed, deleted = self._changed_names, self._deleted_names
+                self._changed_names, self._deleted_names = set(), set()
+                snapshot = (
+                    snapshot_shards(self, path, changed, deleted)
+                    if sharded
+                    else snapshot_blobs(self)
+                )
+
+            # The book is only held for the snapshot, it may change while the
+            # file is written and those changes stay unsaved
+            try:
+                write(snapshot, generation, path)
+            except BaseException:
+                with self.lock:
+                    self._changed_names |= changed - self._deleted_names
+                    self._deleted_names |= deleted - self._changed_names
+                raise
+
+            # Mapped again before taking the book lock too
+            written: MappedRecords | ShardedRecords = (
+                ShardedRecords(path, owner=self)
+                if sharded
+                else MappedRecords(path, owner=self)
+            )
+            with self.lock:
+                self._remap(written)
+                self.generation = generation
+                self.saved_mutations = mutations
+        return conflicts
+
+    def _save_sqlite(self, path: str | Path) -> None:
+        with self.lock:
+            # A book already stored there has written every change through
+            if not (
+                isinstance(self.data, SqliteRecords) and self.data.path == Path(path)
+            ):
+                write_sqlite(self.data.values(), path)
+                self.data = SqliteRecords(path, owner=self)
+            self._changed_names.clear()
+            self._deleted_names.clear()
+            self.saved_mutations = self.mutations
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        # Changes made inside are written through to a SQLite book in a single
+        # transaction, rolled back if the block fails. Other books only write
+        # on save anyway
+        if isinstance(self.data, SqliteRecords):
+            with self.data.batch():
+                yield
+        else:
+            yield
+
+    def close(self) -> None:
+        if isinstance(self.data, SqliteRecords):
+            self.data.close()
+
+    def _remap(self, data: MappedRecords | ShardedRecords) -> None:
+        # Switches to the book as just written, keeping the changes made while
+        # it was being written
+        for name in self._changed_names:
+            data[name] = self.data[name]
+        for name in self._deleted_names:
+            if name in data:
+                del data[name]
+        self.data = data
+
+    def _merge_saved(self, saved: MappedRecords | ShardedRecords) -> list[str]:
+        # Another session saved since this book was loaded: start from its
+        # file and re-apply only the records changed here. Records both sides
+        # changed differently are kept as they are here and reported
+        loaded = self.data
+        if not isinstance(loaded, (MappedRecords, ShardedRecords)):
+            loaded = None
+        conflicts = []
+        for name in self._changed_names | self._deleted_names:
+            ours = self.data[name] if name in self._changed_names else None
+            theirs = saved.load_saved(name)
+            original = loaded.load_saved(name) if loaded else None
+            if _record_state(theirs) not in (
+                _record_state(original),
+                _record_state(ours),
+            ):
+                conflicts.append(name)
+
+            if ours is not None:
+                saved[name] = ours
+            elif name in saved:
+                del saved[name]
+
+        self.data = saved
+        # Records saved by the other session are new here too
+        self.mutations += 1
+        self._birthdays_index = None
+        self._phones_index = None
+        self._names_index = None
+        return sorted(conflicts)
+
+
+def _open_saved(
+    path: str | Path, owner: ContactsBook
+) -> MappedRecords | ShardedRecords | None:
+    if is_sharded_dir(path):
+        return ShardedRecords(path, owner=owner)
+    if is_mapped_file(path):
+        return MappedRecords(path, owner=owner)
+    return None
+
+
+def _record_state(record: ContactRecord | None) -> tuple[str, bytes, int] | None:
+    return record.__getstate__() if record is not None else None
@@ -1,12 +1,159 @@
-from typing import Literal
+from contextlib import contextmanager
+from datetime import date
+from itertools import compress, islice
+from operator import attrgetter
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Literal, Sequence
 
+from .bulk import (
+    RowErrors,
+    check_names,
+    check_repeated,
+    parse_birthdays,
+    parse_phones,
+)
+from .cache import QueryCache
+from .cursor import SortKey
 from .errors import ContactAlreadyExistsError, ContactNotFoundError
+from .exchange import (
+    ContactRow,
+    ExchangeFormat,
+    ImportReport,
+    detect_format,
+    open_for_reading,
+    open_for_writing,
+    read_rows,
+    write_records,
+)
+from .journal import ContactsJournal
 from .models import ContactRecord, ContactsBook
 
+IMPORT_BATCH_SIZE = 10_000
+QUERY_CACHE_SIZE = 256
+
 
 class ContactsService:
-    def __init__(self, contacts: ContactsBook) -> None:
+    def __init__(
+        self,
+        contacts: ContactsBook,
+        *,
+        journal: ContactsJournal | None = None,
+        cache_size: int = QUERY_CACHE_SIZE,
+    ) -> None:
         self._contacts = contacts
+        self._journal = journal
+        self.query_cache = QueryCache(contacts, maxsize=cache_size)
+        # Set while a transaction is open: the state of every contact it
+        # touched, None for new ones, and what it will journal on commit
+        self._undo: dict[str, tuple[str, bytes, int] | None] | None = None
+        self._pending: list[tuple[str, dict[str, Any]]] = []
+        self._compact_pending = False
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        # Changes made inside are applied right away, undone together if the
+        # block fails, and journaled as one entry once it succeeds. A nested
+        # transaction is undone on its own, or joins the outer one
+        outer_undo, outer_pending = self._undo, self._pending
+        self._undo, self._pending = {}, []
+        try:
+            with self._contacts.lock:
+                with self._contacts.batch():
+                    try:
+                        yield
+                    except BaseException:
+                        self._rollback()
+                        raise
+                # Journaled under the book lock, so an autosave can't seal the
+                # journal halfway through
+                if outer_undo is None:
+                    self._commit()
+                else:
+                    for name, state in self._undo.items():
+                        outer_undo.setdefault(name, state)
+                    outer_pending.extend(self._pending)
+        finally:
+            self._undo, self._pending = outer_undo, outer_pending
+
+    def _remember(self, name: str, contact: ContactRecord | None) -> None:
+        # Called with the contact as it is before its first change
+        if self._undo is not None and name not in self._undo:
+            self._undo[name] = contact.__getstate__() if contact else None
+
+    def _rollback(self) -> None:
+        assert self._undo is not None
+        for name, state in self._undo.items():
+            contact = self._contacts.find(name)
+            if state is None:
+                if contact:
+                    self._contacts.delete(name)
+            elif contact:
+                contact._restore(state)
+            else:
+                contact = ContactRecord.__new__(ContactRecord)
+                contact.__setstate__(state)
+                self._contacts.add_record(contact)
+
+    def _commit(self) -> None:
+        if not self._journal:
+            return
+        if len(self._pending) == 1:
+            operation, params = self._pending[0]
+            self._journal.record(operation, **params)
+        elif self._pending:
+            # A single line, so a crash while writing it loses all or nothing
+            entries = [{"op": op, **params} for op, params in self._pending]
+            self._journal.record("batch", entries=entries)
+
+    def _record(self, operation: str, **params: Any) -> None:
+        if not self._journal:
+            return
+        if self._undo is not None:
+            self._pending.append((operation, params))
+        else:
+            # An autosave seals the journal under the book lock
+            with self._contacts.lock:
+                self._journal.record(operation, **params)
+
+    def _record_created(self, contacts: Iterable[ContactRecord]) -> None:
+        # Contacts created in bulk go into one entry, replayed as if they were
+        # created one by one
+        if not self._journal:
+            return
+        entries: list[dict[str, Any]] = []
+        for contact in contacts:
+            name = contact.name.value
+            phones = [phone.value for phone in contact.phones]
+            entries.append(
+                {
+                    "op": "create",
+                    "name": name,
+                    "phone": phones[0] if phones else None,
+                    "birthday": contact.get_birthday("%d.%m.%Y"),
+                }
+            )
+            entries.extend(
+                {"op": "add_phone", "name": name, "phone": phone}
+                for phone in phones[1:]
+            )
+        if entries:
+            self._record("batch", entries=entries)
+
+    def _compact(self) -> None:
+        # Only schedules a snapshot, the changes are journaled all the same
+        if self._journal:
+            self._compact_pending = True
+
+    def compact_if_due(self) -> None:
+        # Saves a snapshot once a bulk change asked for one or the journal has
+        # grown too long. Changes only mark it as due: they run with the book
+        # lock held, and saving takes the book file lock before the book lock,
+        # so callers run this once they have let go of the book lock
+        if not self._journal or self._undo is not None:
+            return
+        if self._compact_pending or self._journal.compaction_due:
+            self._journal.compact(self._contacts)
+            self._compact_pending = False
 
     def create_contact(
         self,
@@ -24,7 +171,9 @@ class ContactsService:
             contact.add_phone(phone)
         if birthday:
             contact.add_birthday(birthday)
+        self._remember(name, None)
         self._contacts.add_record(contact)
+        self._record("create", name=name, phone=phone, birthday=birthday)
 
     def add_contact(
         self,
@@ -38,13 +187,15 @@ class ContactsService:
             self.create_contact(name, phone=phone)
             return "added"
 
+        # The phone isn't kept if the birthday turns out invalid
         updated = []
-        if not contact.phones and phone:
-            self.add_phone(name, phone=phone)
-            updated.append("phone")
-        if not contact.birthday and birthday:
-            self.add_birthday(name, birthday=birthday)
-            updated.append("birthday")
+        with self.transaction():
+            if not contact.phones and phone:
+                self.add_phone(name, phone=phone)
+                updated.append("phone")
+            if not contact.birthday and birthday:
+                self.add_birthday(name, birthday=birthday)
+                updated.append("birthday")
 
         if updated:
             return f"updated:{'|'.join(updated)}"
@@ -56,7 +207,9 @@ class ContactsService:
         if not contact:
             raise ContactNotFoundError(f"Contact '{name}' does not exist.")
 
+        self._remember(name, contact)
         contact.add_phone(phone)
+        self._record("add_phone", name=name, phone=phone)
 
     def add_birthday(
         self,
@@ -69,11 +222,50 @@ class ContactsService:
             raise ContactNotFoundError(f"Contact '{name}' does not exist.")
 
         had_birthday = contact.birthday is not None
+        self._remember(name, contact)
         contact.add_birthday(birthday)
+        self._record("add_birthday", name=name, birthday=birthday)
         return "updated" if had_birthday else "added"
 
     def get_contact(self, name: str) -> ContactRecord | None:
-        return self._contacts.find(name)
+        return self.query_cache.get(
+            ("contact", name), lambda: self._contacts.find(name)
+        )
+
+    def find_contacts_by_phone(self, phone: str) -> list[ContactRecord]:
+        return self.query_cache.get(
+            ("phone", phone), lambda: self._contacts.find_by_phone(phone)
+        )
+
+    def search_contacts(self, query: str, *, limit: int = 10) -> list[ContactRecord]:
+        return self.query_cache.get(
+            ("search", query, limit),
+            lambda: self._contacts.search(query, limit=limit),
+        )
+
+    def list_contacts(
+        self,
+        *,
+        sort: SortKey = "none",
+        name_prefix: str | None = None,
+        limit: int,
+        page: int = 1,
+    ) -> list[ContactRecord]:
+        # Only pages are cached, whole listings are left to a cursor
+        def compute() -> list[ContactRecord]:
+            cursor = self._contacts.cursor(
+                sort=sort, name_prefix=name_prefix, limit=limit
+            )
+            return list(cursor.page(page))
+
+        return self.query_cache.get(("list", sort, name_prefix, limit, page), compute)
+
+    def get_upcoming_birthdays(self, days: int = 7) -> list[dict]:
+        # The result also depends on today's date
+        return self.query_cache.get(
+            ("birthdays", days, date.today()),
+            lambda: self._contacts.get_upcoming_birthdays(days),
+        )
 
     def update_contact(
         self,
@@ -86,7 +278,95 @@ class ContactsService:
         if not contact:
             raise ContactNotFoundError(f"Contact '{name}' does not exist.")
 
-        if phone:
-            contact.edit_phone(phone[0], phone[1])
-        if birthday:
-            contact.add_birthday(birthday)
+        with self.transaction():
+            self._remember(name, contact)
+            if phone:
+                contact.edit_phone(phone[0], phone[1])
+            if birthday:
+                contact.add_birthday(birthday)
+            self._record("update", name=name, phone=phone, birthday=birthday)
+
+    def create_contacts_bulk(self, rows: Sequence[ContactRow]) -> ImportReport:
+        imported, errors = self._create_rows(rows)
+        # A snapshot spares replaying the whole batch from the journal
+        if imported:
+            self._compact()
+        return ImportReport(imported=imported, errors=errors)
+
+    def _create_rows(
+        self, rows: Sequence[ContactRow]
+    ) -> tuple[int, list[tuple[int, str]]]:
+        # Every column is validated as a whole first, then the valid rows are
+        # added without another lookup or check per field
+        row_errors: RowErrors = {}
+        names = list(map(attrgetter("name"), rows))
+        check_names(names, self._contacts.data, row_errors)
+        phones = parse_phones(list(map(attrgetter("phones"), rows)), row_errors)
+        birthdays = parse_birthdays(list(map(attrgetter("birthday"), rows)), row_errors)
+        if not self._contacts.unique_phones:
+            check_repeated(names, row_errors)
+
+        contacts = list(map(ContactRecord._trusted, names, phones, birthdays))
+        valid = [True] * len(contacts)
+        for i in row_errors:
+            valid[i] = False
+        if self._undo is not None:
+            # Names were checked to be free, a rollback deletes them again
+            for name in compress(names, valid):
+                self._undo.setdefault(name, None)
+        if not self._contacts.unique_phones:
+            created = list(compress(contacts, valid))
+            self._contacts.add_records(created)
+        else:
+            created = []
+            # Phones may also be owned by other contacts, checked one by one.
+            # So are repeated names, as the earlier row may fail on its phone
+            for i, name in enumerate(names):
+                if name in self._contacts.data:
+                    row_errors[i] = f"Contact '{name}' already exists."
+                    continue
+                if not valid[i]:
+                    continue
+                try:
+                    self._contacts.add_record(contacts[i])
+                except ValueError as e:
+                    row_errors[i] = str(e)
+                else:
+                    created.append(contacts[i])
+        self._record_created(created)
+        imported = len(created)
+
+        errors = [(rows[i].number, row_errors[i]) for i in sorted(row_errors)]
+        return imported, errors
+
+    def import_contacts(
+        self,
+        path: str | Path,
+        *,
+        format: ExchangeFormat | None = None,
+    ) -> ImportReport:
+        format = format or detect_format(path)
+        imported = 0
+        errors: list[tuple[int, str]] = []
+
+        with open_for_reading(path) as f:
+            rows = read_rows(f, format)
+            while batch := list(islice(rows, IMPORT_BATCH_SIZE)):
+                batch_imported, batch_errors = self._create_rows(batch)
+                imported += batch_imported
+                errors.extend(batch_errors)
+
+        # A snapshot spares replaying the whole import from the journal
+        if imported:
+            self._compact()
+        return ImportReport(imported=imported, errors=errors)
+
+    def export_contacts(
+        self,
+        path: str | Path,
+        *,
+        format: ExchangeFormat | None = None,
+    ) -> int:
+        format = format or detect_format(path)
+        with open_for_writing(path) as f:
+            return write_records(f, self._contacts.values(), format)
@@ -0,0 +1,227 @@
+import heapq
+import json
+import os
+import zlib
+from collections.abc import MutableMapping
+from itertools import chain
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterator, NamedTuple
+
+from .mapped import (
+    MappedRecords,
+    encode_record,
+    is_mapped_file,
+    snapshot_blobs,
+    write_mapped,
+)
+from .views import RecordsViews
+
+if TYPE_CHECKING:
+    from multiprocessing.context import BaseContext
+
+    from .models import ContactRecord, ContactsBook
+
+# Directory layout: manifest.json | shard-000.map ... shard-<N-1>.map, every
+# shard a mapped book holding the names that hash to it
+MANIFEST = "manifest.json"
+SHARD_COUNT = 16
+# Forking workers costs more than it saves below this many records to write
+PARALLEL_MIN_RECORDS = 100_000
+
+
+def shard_of(name: str, count: int) -> int:
+    # Stable across processes, unlike hash()
+    return zlib.crc32(name.encode()) % count
+
+
+def shard_path(path: str | Path, i: int) -> Path:
+    return Path(path) / f"shard-{i:03d}.map"
+
+
+def is_sharded_dir(path: str | Path) -> bool:
+    return (Path(path) / MANIFEST).is_file()
+
+
+def read_manifest(path: str | Path) -> dict[str, int] | None:
+    try:
+        with open(Path(path) / MANIFEST, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def read_sharded_generation(path: str | Path) -> int:
+    manifest = read_manifest(path)
+    return manifest["generation"] if manifest else 0
+
+
+def write_manifest(path: str | Path, *, shards: int, generation: int) -> None:
+    manifest_path = Path(path) / MANIFEST
+    tmp_path = manifest_path.with_name(MANIFEST + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"shards": shards, "generation": generation}, f)
+    os.replace(tmp_path, manifest_path)
+
+
+class ShardedRecords(RecordsViews, MutableMapping):
+    # Every name is looked up, changed or deleted in its own shard only. Saved
+    # shards are mapped, missing ones start out as plain dicts
+    def __init__(
+        self, path: str | Path, owner: "ContactsBook", *, shards: int = SHARD_COUNT
+    ) -> None:
+        manifest = read_manifest(path)
+        count = manifest["shards"] if manifest else shards
+        self.path = Path(path)
+        self.generation = manifest["generation"] if manifest else 0
+        self.shards: list[MutableMapping[str, ContactRecord]] = []
+        for i in range(count):
+            if is_mapped_file(shard_path(path, i)):
+                self.shards.append(MappedRecords(shard_path(path, i), owner=owner))
+            else:
+                self.shards.append({})
+
+    def shard(self, name: str) -> MutableMapping[str, "ContactRecord"]:
+        return self.shards[shard_of(name, len(self.shards))]
+
+    def load_saved(self, name: str) -> "ContactRecord | None":
+        shard = self.shard(name)
+        return shard.load_saved(name) if isinstance(shard, MappedRecords) else None
+
+    def __getitem__(self, name: str) -> "ContactRecord":
+        return self.shard(name)[name]
+
+    def __setitem__(self, name: str, record: "ContactRecord") -> None:
+        self.shard(name)[name] = record
+
+    def __delitem__(self, name: str) -> None:
+        del self.shard(name)[name]
+
+    def __contains__(self, name: object) -> bool:
+        return isinstance(name, str) and name in self.shard(name)
+
+    def __len__(self) -> int:
+        return sum(map(len, self.shards))
+
+    def __iter__(self) -> Iterator[str]:
+        return chain.from_iterable(self.shards)
+
+    def iter_records(self) -> Iterator["ContactRecord"]:
+        for shard in self.shards:
+            yield from shard.values()
+
+    def snapshot_blobs(self) -> Iterator[tuple[str, bytes]]:
+        # Every shard is in name order, merged into one stream for a mapped file
+        return heapq.merge(
+            *map(_shard_blobs, self.shards), key=lambda item: item[0].encode()
+        )
+
+
+def _shard_blobs(
+    shard: MutableMapping[str, "ContactRecord"]
+) -> Iterator[tuple[str, bytes]]:
+    if isinstance(shard, MappedRecords):
+        return shard.snapshot_blobs()
+    names = sorted(shard, key=str.encode)
+    return iter([(name, encode_record(shard[name])) for name in names])
+
+
+class ShardWrite(NamedTuple):
+    path: Path
+    # Encoded records to write and names to drop. A replaced shard is made of
+    # the blobs alone, otherwise they are merged into the saved shard
+    blobs: dict[str, bytes]
+    deleted: set[str]
+    replace: bool
+    records: int  # roughly how many records the shard ends up with
+
+
+class ShardedSnapshot(NamedTuple):
+    shards: int
+    writes: list[ShardWrite]
+
+
+def snapshot_shards(
+    contacts: "ContactsBook",
+    path: str | Path,
+    changed: set[str],
+    deleted: set[str],
+) -> ShardedSnapshot:
+    # Only the shards holding changed or deleted names are rewritten, unless
+    # the book isn't stored in these shards yet and all of them are
+    data = contacts.data
+    if isinstance(data, ShardedRecords) and data.path == Path(path):
+        count = len(data.shards)
+        groups: dict[int, tuple[list[str], set[str]]] = {}
+        for name in changed:
+            groups.setdefault(shard_of(name, count), ([], set()))[0].append(name)
+        for name in deleted:
+            groups.setdefault(shard_of(name, count), ([], set()))[1].add(name)
+
+        writes = []
+        for i in sorted(groups):
+            shard = data.shards[i]
+            changed_names, deleted_names = groups[i]
+            if isinstance(shard, MappedRecords):
+                blobs = {name: encode_record(shard[name]) for name in changed_names}
+                replace, records = False, len(shard)
+            else:
+                # Never saved, so the whole shard is written
+                blobs = {name: encode_record(record) for name, record in shard.items()}
+                replace, records = True, len(blobs)
+            writes.append(
+                ShardWrite(shard_path(path, i), blobs, deleted_names, replace, records)
+            )
+        return ShardedSnapshot(count, writes)
+
+    manifest = read_manifest(path)
+    count = manifest["shards"] if manifest else SHARD_COUNT
+    shards: list[dict[str, bytes]] = [{} for _ in range(count)]
+    for name, blob in snapshot_blobs(contacts):
+        shards[shard_of(name, count)][name] = blob
+    return ShardedSnapshot(
+        count,
+        [
+            ShardWrite(shard_path(path, i), blobs, set(), True, len(blobs))
+            for i, blobs in enumerate(shards)
+        ],
+    )
+
+
+def write_sharded(snapshot: ShardedSnapshot, generation: int, path: str | Path) -> None:
+    writes = snapshot.writes
+    Path(path).mkdir(exist_ok=True)
+    workers = min(len(writes), os.cpu_count() or 1)
+    if workers > 1 and sum(w.records for w in writes) >= PARALLEL_MIN_RECORDS:
+        # Imported here, so the bot doesn't pay for it at startup
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(workers, mp_context=_pool_context()) as pool:
+            # Consumed, so a failed shard raises here
+            list(pool.map(write_shard, writes, [generation] * len(writes)))
+    else:
+        for write in writes:
+            write_shard(write, generation)
+
+    # Shards are replaced one by one, the manifest marks the save as complete
+    write_manifest(path, shards=snapshot.shards, generation=generation)
+
+
+def write_shard(write: ShardWrite, generation: int) -> None:
+    # Runs in a worker process, so it only gets the changes and reads the
+    # rest of the shard from its file
+    if write.replace or not is_mapped_file(write.path):
+        blobs = iter(sorted(write.blobs.items(), key=lambda item: item[0].encode()))
+    else:
+        saved = MappedRecords(write.path, owner=None)  # type: ignore[arg-type]
+        blobs = saved.merged_blobs(write.blobs, write.deleted)
+    write_mapped(blobs, generation, write.path)
+
+
+def _pool_context() -> "BaseContext | None":
+    # Workers aren't forked from the bot, which runs the autosave and loader
+    # threads, where the platform allows it
+    import multiprocessing
+
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return None
@@ -0,0 +1,124 @@
+import pickle
+import threading
+from collections.abc import Mapping
+from itertools import islice
+from typing import TYPE_CHECKING, Iterator
+
+from .mapped import MappedRecords
+from .views import RecordsViews
+
+if TYPE_CHECKING:
+    from .models import ContactRecord
+
+# Records read per lock hold when iterating over values or items
+READ_CHUNK = 256
+
+
+class SnapshotRecords(RecordsViews, Mapping):
+    # The records of a book as they were when the snapshot was taken. Nothing
+    # is copied upfront: unchanged records are read from the book's storage,
+    # and the book hands every record over to its live snapshots right before
+    # changing, adding or deleting it (copy on write). Each read holds the book
+    # lock for a single lookup, so the book keeps changing in between
+    def __init__(
+        self, data: Mapping[str, "ContactRecord"], lock: threading.RLock
+    ) -> None:
+        self._data = data
+        self._lock = lock
+        # States of records changed since the snapshot, None for new ones
+        self._preserved: dict[str, tuple[str, bytes, int] | None] = {}
+        self._names: list[str] | None = None
+
+    def preserve(self, name: str) -> None:
+        # Called by the book with its lock held, before the record changes
+        if name not in self._preserved:
+            self._preserved[name] = self._read_state(name)
+
+    def _read_state(self, name: str) -> tuple[str, bytes, int] | None:
+        record = self._data.get(name)
+        return record.__getstate__() if record is not None else None
+
+    def _state(self, name: str) -> tuple[str, bytes, int] | None:
+        with self._lock:
+            if name in self._preserved:
+                return self._preserved[name]
+            return self._read_state(name)
+
+    def __getitem__(self, name: str) -> "ContactRecord":
+        state = self._state(name)
+        if state is None:
+            raise KeyError(name)
+        return _detached(state)
+
+    def __contains__(self, name: object) -> bool:
+        return isinstance(name, str) and self._state(name) is not None
+
+    def __len__(self) -> int:
+        return len(self._snapshot_names())
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._snapshot_names())
+
+    def iter_records(self) -> Iterator["ContactRecord"]:
+        # Read a chunk at a time, taking the book lock once per chunk rather
+        # than once per record. Unchanged records of a mapped book are decoded
+        # straight from the file in file order, skipping the lookup by name
+        names = self._snapshot_names()
+        listed = 0
+        if isinstance(self._data, MappedRecords):
+            saved = self._data.saved_blobs()
+            while chunk := list(islice(saved, READ_CHUNK)):
+                with self._lock:
+                    items = []
+                    for name, blob in chunk:
+                        # Names are listed in file order too, minus the ones
+                        # missing when they were listed
+                        if listed == len(names) or names[listed] != name:
+                            continue
+                        listed += 1
+                        if name in self._preserved:
+                            items.append(self._preserved[name])
+                        elif self._data.is_saved(name):
+                            items.append(blob)
+                        else:
+                            items.append(self._read_state(name))
+                yield from map(_detached, filter(None, items))
+
+        for start in range(listed, len(names), READ_CHUNK):
+            with self._lock:
+                states = [
+                    self._preserved[name]
+                    if name in self._preserved
+                    else self._read_state(name)
+                    for name in names[start : start + READ_CHUNK]
+                ]
+            yield from map(_detached, filter(None, states))
+
+    def _snapshot_names(self) -> list[str]:
+        # Listed on first use: names added since are left out, deleted ones
+        # are put back
+        if self._names is None:
+            with self._lock:
+                names = list(self._data)
+                preserved = dict(self._preserved)
+            current = set(names)
+            self._names = [
+                name for name in names if preserved.get(name, ()) is not None
+            ]
+            self._names += [
+                name
+                for name, state in preserved.items()
+                if state is not None and name not in current
+            ]
+        return self._names
+
+
+def _detached(state: tuple[str, bytes, int] | bytes) -> "ContactRecord":
+    from .models import ContactRecord
+
+    # A copy of its own, later changes to the book's record don't show
+    if isinstance(state, bytes):
+        return pickle.loads(state)
+    record = ContactRecord.__new__(ContactRecord)
+    record.__setstate__(state)
+    return record
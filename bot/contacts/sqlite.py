@@ -0,0 +1,302 @@
+import weakref
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from datetime import date
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator
+
+from .indexes import BirthdayKey, DayKey, birthday_ranges
+from .views import RecordsViews
+
+if TYPE_CHECKING:
+    import sqlite3
+
+    from .models import ContactRecord, ContactsBook
+
+MAGIC = b"SQLite format 3\0"
+SUFFIXES = (".db", ".sqlite", ".sqlite3")
+
+# Records are stored in their compact form, with the birthday month and day
+# and every phone copied out so they can be looked up by an index
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS contacts (
+    name TEXT PRIMARY KEY,
+    phones BLOB NOT NULL,
+    birthday INTEGER,
+    birth_month INTEGER,
+    birth_day INTEGER
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS contacts_by_birthday
+    ON contacts (birth_month, birth_day, name) WHERE birthday IS NOT NULL;
+CREATE TABLE IF NOT EXISTS phones (
+    phone TEXT NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (phone, name)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS phones_by_name ON phones (name);
+"""
+
+UPSERT_CONTACT = """
+INSERT INTO contacts (name, phones, birthday, birth_month, birth_day)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (name) DO UPDATE SET
+    phones = excluded.phones,
+    birthday = excluded.birthday,
+    birth_month = excluded.birth_month,
+    birth_day = excluded.birth_day
+"""
+
+
+def is_sqlite_file(path: str | Path) -> bool:
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except FileNotFoundError:
+        return False
+
+
+def connect(path: str | Path) -> "sqlite3.Connection":
+    # Imported here, so mapped books don't pay for it at startup
+    import sqlite3
+
+    # Shared with the autosave and loader threads, the book lock serializes use
+    conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    try:
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA busy_timeout = 5000")
+        conn.executescript(SCHEMA)
+    except sqlite3.DatabaseError as e:
+        conn.close()
+        raise ValueError(f"Cannot open '{path}' as a SQLite book: {e}")
+    return conn
+
+
+class SqliteRecords(RecordsViews, MutableMapping):
+    # Records are read on demand and every change is written through in its
+    # own small transaction, so there is nothing left to save. Inside a batch
+    # changes are held back and written together, once per record
+    def __init__(self, path: str | Path, owner: "ContactsBook") -> None:
+        self.path = Path(path)
+        self._conn = connect(path)
+        self._owner = owner
+        self._cache: weakref.WeakValueDictionary[str, ContactRecord] = (
+            weakref.WeakValueDictionary()
+        )
+        self.phones_index = SqlitePhonesIndex(self._conn, self.flush)
+        self.birthdays_index = SqliteBirthdaysIndex(self._conn, self.flush)
+        self._in_batch = False
+        # Changed records, None for deleted ones, not written yet
+        self._pending: dict[str, ContactRecord | None] = {}
+        self._data_version = self._read_data_version()
+
+    def _decode(self, row: tuple[str, bytes, int | None]) -> "ContactRecord":
+        from .models import ContactRecord
+
+        name, phones, birthday = row
+        record = self._cache.get(name)
+        if record is None:
+            record = ContactRecord.__new__(ContactRecord)
+            record.__setstate__((name, phones, birthday or 0))
+            record._book = self._owner
+            self._cache[name] = record
+        return record
+
+    def _read_data_version(self) -> int:
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def data_version(self) -> int:
+        # Changes when another connection commits, records decoded before then
+        # may be out of date and are decoded again
+        version = self._read_data_version()
+        if version != self._data_version:
+            self._data_version = version
+            self._cache.clear()
+        return version
+
+    def __getitem__(self, name: str) -> "ContactRecord":
+        if name in self._pending:
+            record = self._pending[name]
+            if record is None:
+                raise KeyError(name)
+            return record
+
+        row = self._conn.execute(
+            "SELECT name, phones, birthday FROM contacts WHERE name = ?", (name,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(name)
+        return self._decode(row)
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        # One transaction for every change made inside, nested batches join
+        # the outer one
+        if self._in_batch:
+            yield
+            return
+
+        self._in_batch = True
+        try:
+            with self._conn:
+                self._conn.execute("BEGIN")
+                yield
+                self.flush()
+        except BaseException:
+            # Cached records may hold changes that were just rolled back
+            self._pending.clear()
+            self._cache.clear()
+            raise
+        finally:
+            self._in_batch = False
+
+    def flush(self) -> None:
+        # Writes the held back changes, still inside the batch transaction, so
+        # queries answered by SQLite see them
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        deleted = [(name,) for name, record in pending.items() if record is None]
+        self._conn.executemany("DELETE FROM contacts WHERE name = ?", deleted)
+        self._conn.executemany("DELETE FROM phones WHERE name = ?", deleted)
+        write_records(self._conn, [r for r in pending.values() if r is not None])
+
+    def __setitem__(self, name: str, record: "ContactRecord") -> None:
+        if self._in_batch:
+            self._pending[name] = record
+        else:
+            with self.batch():
+                write_records(self._conn, [record])
+        self._cache[name] = record
+
+    def __delitem__(self, name: str) -> None:
+        if name not in self:
+            raise KeyError(name)
+        with self.batch():
+            self._pending[name] = None
+        self._cache.pop(name, None)
+
+    def __contains__(self, name: object) -> bool:
+        if not isinstance(name, str):
+            return False
+        if name in self._pending:
+            return self._pending[name] is not None
+        row = self._conn.execute(
+            "SELECT 1 FROM contacts WHERE name = ?", (name,)
+        ).fetchone()
+        return row is not None
+
+    def __len__(self) -> int:
+        self.flush()
+        return self._conn.execute("SELECT count(*) FROM contacts").fetchone()[0]
+
+    def __iter__(self) -> Iterator[str]:
+        self.flush()
+        for (name,) in self._conn.execute("SELECT name FROM contacts"):
+            yield name
+
+    def iter_records(self) -> Iterator["ContactRecord"]:
+        self.flush()
+        rows = self._conn.execute("SELECT name, phones, birthday FROM contacts")
+        for row in rows:
+            yield self._decode(row)
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class SqlitePhonesIndex:
+    # Same interface as PhonesIndex, kept up to date by the phones table
+    def __init__(self, conn: "sqlite3.Connection", flush: Callable[[], None]) -> None:
+        self._conn = conn
+        self._flush = flush
+
+    def update(self, record: "ContactRecord") -> None:
+        pass
+
+    def discard(self, name: str) -> None:
+        pass
+
+    def find(self, phone: str) -> list[str]:
+        self._flush()
+        rows = self._conn.execute("SELECT name FROM phones WHERE phone = ?", (phone,))
+        return [name for (name,) in rows]
+
+
+class SqliteBirthdaysIndex:
+    # Same interface as BirthdaysIndex, answered by the month/day index
+    def __init__(self, conn: "sqlite3.Connection", flush: Callable[[], None]) -> None:
+        self._conn = conn
+        self._flush = flush
+
+    def __len__(self) -> int:
+        self._flush()
+        return self._conn.execute(
+            "SELECT count(*) FROM contacts WHERE birthday IS NOT NULL"
+        ).fetchone()[0]
+
+    def update(self, record: "ContactRecord") -> None:
+        pass
+
+    def discard(self, name: str) -> None:
+        pass
+
+    def names(self) -> Iterator[str]:
+        self._flush()
+        rows = self._conn.execute(
+            "SELECT name FROM contacts WHERE birthday IS NOT NULL "
+            "ORDER BY birth_month, birth_day, name"
+        )
+        return (name for (name,) in rows)
+
+    def names_between(self, start: date, end: date) -> Iterator[str]:
+        return (name for _, _, name in self.keys_between(start, end))
+
+    def keys_between(self, start: date, end: date) -> Iterator[BirthdayKey]:
+        self._flush()
+        for start_key, end_key in birthday_ranges(start, end):
+            yield from self._keys_in_range(start_key, end_key)
+
+    def _keys_in_range(
+        self, start_key: DayKey, end_key: DayKey
+    ) -> Iterator[BirthdayKey]:
+        return self._conn.execute(
+            "SELECT birth_month, birth_day, name FROM contacts "
+            "WHERE birthday IS NOT NULL "
+            "AND (birth_month, birth_day) >= (?, ?) "
+            "AND (birth_month, birth_day) < (?, ?) "
+            "ORDER BY birth_month, birth_day, name",
+            (*start_key, *end_key),
+        )
+
+
+def write_records(conn: "sqlite3.Connection", records: list["ContactRecord"]) -> None:
+    rows = []
+    for record in records:
+        name, phones, birthday = record.__getstate__()
+        month = day = None
+        if birthday:
+            birth_date = date.fromordinal(birthday)
+            month, day = birth_date.month, birth_date.day
+        rows.append((name, phones, birthday or None, month, day))
+    conn.executemany(UPSERT_CONTACT, rows)
+    conn.executemany(
+        "DELETE FROM phones WHERE name = ?", [(record._name,) for record in records]
+    )
+    conn.executemany(
+        "INSERT OR IGNORE INTO phones (phone, name) VALUES (?, ?)",
+        [(phone.value, record._name) for record in records for phone in record.phones],
+    )
+
+
+def write_sqlite(records: Iterable["ContactRecord"], path: str | Path) -> None:
+    # Replaces the whole database content in one transaction
+    conn = connect(path)
+    try:
+        with conn:
+            conn.execute("BEGIN")
+            conn.execute("DELETE FROM contacts")
+            conn.execute("DELETE FROM phones")
+            write_records(conn, list(records))
+    finally:
+        conn.close()
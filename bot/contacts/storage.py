@@ -0,0 +1,25 @@
+from pathlib import Path
+from typing import Literal
+
+from .sqlite import SUFFIXES as SQLITE_SUFFIXES
+from .sqlite import is_sqlite_file
+
+StorageBackend = Literal["mapped", "sqlite", "sharded"]
+STORAGE_BACKENDS: tuple[StorageBackend, ...] = ("mapped", "sqlite", "sharded")
+
+# How mapped books are compressed on save, "none" keeps them mappable
+Codec = Literal["none", "zlib", "bz2", "lzma"]
+CODECS: tuple[Codec, ...] = ("none", "zlib", "bz2", "lzma")
+
+
+def detect_backend(path: str | Path) -> StorageBackend:
+    # An existing file decides by its content, a new one by its extension.
+    # Sharded books are directories
+    path = Path(path)
+    if path.is_dir():
+        return "sharded"
+    if is_sqlite_file(path):
+        return "sqlite"
+    if path.exists() or path.suffix.lower() not in SQLITE_SUFFIXES:
+        return "mapped"
+    return "sqlite"
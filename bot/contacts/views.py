@@ -0,0 +1,34 @@
+from abc import ABC, abstractmethod
+from collections.abc import ItemsView, ValuesView
+from typing import TYPE_CHECKING, Iterator
+
+if TYPE_CHECKING:
+    from .models import ContactRecord
+
+
+class RecordsViews(ABC):
+    # Mixed into record mappings that read their records faster in bulk than
+    # by looking up every name: values() and items() go through iter_records()
+    @abstractmethod
+    def iter_records(self) -> Iterator["ContactRecord"]: ...
+
+    def values(self) -> ValuesView:
+        return _RecordsValuesView(self)  # type: ignore[arg-type]
+
+    def items(self) -> ItemsView:
+        return _RecordsItemsView(self)  # type: ignore[arg-type]
+
+
+class _RecordsValuesView(ValuesView):
+    _mapping: RecordsViews
+
+    def __iter__(self) -> Iterator["ContactRecord"]:
+        return self._mapping.iter_records()
+
+
+class _RecordsItemsView(ItemsView):
+    _mapping: RecordsViews
+
+    def __iter__(self) -> Iterator[tuple[str, "ContactRecord"]]:
+        for record in self._mapping.iter_records():
+            yield record.name.value, record
@@ -0,0 +1,304 @@
+import io
+import sys
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import TYPE_CHECKING, Any, Callable, Generic, Iterator, TextIO, TypeVar
+
+from bot.bot_commands import StopCommandsLoop, bot_commands
+from bot.commands import (
+    BACKGROUND_MARKER,
+    CommandNotFoundError,
+    CommandsDispatcher,
+    InvalidCommandArgumentsError,
+    ParsedCommand,
+)
+from bot.contacts import (
+    ContactAlreadyExistsError,
+    ContactNotFoundError,
+    ContactsService,
+)
+
+if TYPE_CHECKING:
+    from concurrent.futures import Future, ThreadPoolExecutor
+
+commands_dispatcher = CommandsDispatcher(bot_commands)
+
+REPORT_WORKERS = 2
+
+T = TypeVar("T")
+
+
+class Deferred(Generic[T]):
+    # Computes a value on a background thread, result() waits for it
+    def __init__(self, func: Callable[[], T]) -> None:
+        self._result: T | None = None
+        self._error: BaseException | None = None
+        self._thread = threading.Thread(target=self._run, args=(func,), daemon=True)
+        self._thread.start()
+
+    def _run(self, func: Callable[[], T]) -> None:
+        try:
+            self._result = func()
+        except BaseException as e:
+            self._error = e
+
+    def result(self) -> T:
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+        return self._result  # type: ignore[return-value]
+
+
+def resolve_context(context: dict[str, Any]) -> dict[str, Any]:
+    return {
+        key: value.result() if isinstance(value, Deferred) else value
+        for key, value in context.items()
+    }
+
+
+def handle_invalid_command_args_error(error: InvalidCommandArgumentsError) -> None:
+    if error.required_args and error.optional_args:
+        print(
+            f"Give me {error.required_args_str} please, and optionally {error.optional_args_str}."
+        )
+    elif error.required_args:
+        print(f"Give me {error.required_args_str} pleaserror.")
+    elif error.optional_args:
+        print(f"You can optionally provide {error.optional_args_str}.")
+    else:
+        print("This command doesn't take any arguments.")
+
+
+def execute_command(
+    command: str,
+    command_args: list[str],
+    *,
+    reports: "BackgroundReports | None" = None,
+    remote: bool = False,
+    **context: Any,
+) -> bool:
+    try:
+        if remote and commands_dispatcher.is_local(command):
+            raise ValueError(f"Command '{command}' isn't available over the server.")
+        if command_args[-1:] == [BACKGROUND_MARKER]:
+            if reports is None or not commands_dispatcher.is_report(command):
+                raise ValueError(f"Command '{command}' can't run in the background.")
+            reports.start(command, command_args[:-1], resolve_context(context))
+            return True
+
+        # Only commands using the context wait for the book to load, and they
+        # see it as a whole, autosaves happen between them
+        lock = nullcontext()
+        takes_context = commands_dispatcher.takes_context(command)
+        if takes_context:
+            context = resolve_context(context)
+            lock = context["contacts"].lock
+        with lock:
+            commands_dispatcher.run_command(command, *command_args, **context)
+        if takes_context:
+            compact_if_due(context)
+    except CommandNotFoundError:
+        print("Invalid command.")
+    except InvalidCommandArgumentsError as e:
+        handle_invalid_command_args_error(e)
+    except ContactNotFoundError:
+        print("Contact doesn't exist.")
+    except ContactAlreadyExistsError:
+        print("Contact already exists.")
+    except ValueError as e:
+        print(e)
+    except StopCommandsLoop:
+        raise
+    except Exception as e:
+        print(f"Whoops, an unexpected error occurred: {e}")
+    else:
+        return True
+    return False
+
+
+def execute_pipeline(
+    commands: list[ParsedCommand],
+    *,
+    stop_on_error: bool = False,
+    reports: "BackgroundReports | None" = None,
+    **context: Any,
+) -> int:
+    # Runs the commands of one input line in order and returns how many failed.
+    # A failure only skips the rest with stop_on_error, and whatever the
+    # commands print is written out at once when they are done
+    if len(commands) == 1:
+        command, command_args = commands[0]
+        succeeded = execute_command(command, command_args, reports=reports, **context)
+        return 0 if succeeded else 1
+
+    output = io.StringIO()
+    failed = 0
+    stop = False
+    try:
+        with capture_output(output), _pipeline_scope(commands, context) as context:
+            for command, command_args in commands:
+                try:
+                    succeeded = execute_command(
+                        command, command_args, reports=reports, **context
+                    )
+                except StopCommandsLoop:
+                    # Changes made before it are kept
+                    stop = True
+                    break
+                if not succeeded:
+                    failed += 1
+                    if stop_on_error:
+                        break
+    finally:
+        sys.stdout.write(output.getvalue())
+
+    if stop:
+        raise StopCommandsLoop
+    return failed
+
+
+@contextmanager
+def _pipeline_scope(
+    commands: list[ParsedCommand], context: dict[str, Any]
+) -> Iterator[dict[str, Any]]:
+    # The book is waited for once, and every change the commands make is
+    # journaled as one when the last of them is done, or undone together if
+    # the pipeline is interrupted
+    if not any(_takes_context(command) for command, _ in commands):
+        yield context
+        return
+
+    context = resolve_context(context)
+    with context["contacts_service"].transaction():
+        yield context
+    compact_if_due(context)
+
+
+def compact_if_due(context: dict[str, Any]) -> None:
+    # Called once the book lock is released, saving takes it after the book
+    # file lock. A failed save leaves the changes journaled for the next one
+    try:
+        context["contacts_service"].compact_if_due()
+    except OSError as e:
+        print(f"Saving the book failed: {e}", file=sys.stderr)
+
+
+def _takes_context(command: str) -> bool:
+    try:
+        return commands_dispatcher.takes_context(command)
+    except CommandNotFoundError:
+        return False
+
+
+class _ThreadOutput(io.TextIOBase):
+    # Installed as sys.stdout once output is first captured: every thread
+    # writes to its own capture target, or to the stream that was there before
+    def __init__(self, stream: TextIO) -> None:
+        self.stream = stream
+        self._local = threading.local()
+
+    @property
+    def target(self) -> TextIO:
+        target = getattr(self._local, "target", None)
+        return target if target is not None else self.stream
+
+    def write(self, text: str) -> int:
+        return self.target.write(text)
+
+    def flush(self) -> None:
+        self.target.flush()
+
+    def fileno(self) -> int:
+        # Lets input() see the terminal and keep line editing
+        return self.stream.fileno()
+
+    def isatty(self) -> bool:
+        return self.stream.isatty()
+
+
+_install_lock = threading.Lock()
+
+
+def _thread_output() -> _ThreadOutput:
+    # Threads capturing output for the first time at once must end up sharing
+    # one proxy, or the output of all but one of them goes to the real stream
+    stdout = sys.stdout
+    if isinstance(stdout, _ThreadOutput):
+        return stdout
+    with _install_lock:
+        if not isinstance(sys.stdout, _ThreadOutput):
+            sys.stdout = _ThreadOutput(sys.stdout)
+        return sys.stdout
+
+
+@contextmanager
+def capture_output(target: TextIO) -> Iterator[TextIO]:
+    # Like redirect_stdout, but only for the calling thread, so background
+    # reports and the command loop never get each other's output
+    stdout = _thread_output()
+    previous = getattr(stdout._local, "target", None)
+    stdout._local.target = target
+    try:
+        yield target
+    finally:
+        stdout._local.target = previous
+
+
+class BackgroundReports:
+    # Report commands ending with '&' run in a thread pool on a snapshot of the
+    # book taken when they are started, so the command loop keeps taking
+    # changes meanwhile. Their output is kept until the loop prints it
+    _pool: "ThreadPoolExecutor | None" = None
+
+    def __init__(self) -> None:
+        self._started: list[tuple[str, "Future[str]"]] = []
+
+    def __len__(self) -> int:
+        return len(self._started)
+
+    def start(
+        self, command: str, command_args: list[str], context: dict[str, Any]
+    ) -> None:
+        snapshot = context["contacts"].snapshot()
+        context = {
+            **context,
+            "contacts": snapshot,
+            "contacts_service": ContactsService(snapshot),
+        }
+        future = self._get_pool().submit(_run_report, command, command_args, context)
+        self._started.append((command, future))
+
+    def pop_finished(self, *, wait: bool = False) -> list[tuple[str, str]]:
+        # Command and output of the reports done so far, or of all of them
+        finished = []
+        for command, future in list(self._started):
+            if wait or future.done():
+                finished.append((command, future.result()))
+                self._started.remove((command, future))
+        return finished
+
+    def pop_started(self) -> list[tuple[str, "Future[str]"]]:
+        started, self._started = self._started, []
+        return started
+
+    @classmethod
+    def _get_pool(cls) -> "ThreadPoolExecutor":
+        # Shared by every session, created when the first report is started
+        if cls._pool is None:
+            from concurrent.futures import ThreadPoolExecutor
+
+            cls._pool = ThreadPoolExecutor(REPORT_WORKERS, thread_name_prefix="report")
+        return cls._pool
+
+
+def _run_report(command: str, command_args: list[str], context: dict[str, Any]) -> str:
+    output = io.StringIO()
+    with capture_output(output):
+        execute_command(command, command_args, **context)
+    return output.getvalue()
+
+
+def print_reports(reports: list[tuple[str, str]]) -> None:
+    for command, output in reports:
+        print(f"Report '{command}' is ready:")
+        sys.stdout.write(output)
@@ -0,0 +1,129 @@
+import asyncio
+import io
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Any
+
+from bot.bot_commands import StopCommandsLoop
+from bot.runner import (
+    BackgroundReports,
+    capture_output,
+    commands_dispatcher,
+    execute_pipeline,
+)
+
+# Every response is the command output followed by an empty line, commands
+# never print empty lines themselves
+RESPONSE_END = b"\n"
+BACKLOG = 1024
+
+
+def parse_address(address: str) -> tuple[str, str | int]:
+    if address.startswith("unix:"):
+        return "unix", address.removeprefix("unix:")
+
+    host, sep, port = address.rpartition(":")
+    if not sep or not port.isdigit():
+        raise ValueError(f"Invalid address '{address}'. Use HOST:PORT or unix:PATH")
+    return host or "127.0.0.1", int(port)
+
+
+def run_line(
+    line: str,
+    *,
+    stop_on_error: bool = False,
+    reports: BackgroundReports | None = None,
+    **context: Any,
+) -> tuple[str, bool]:
+    output = io.StringIO()
+    stop = False
+
+    commands = commands_dispatcher.parse_pipeline(line)
+    if commands:
+        # Lines run one at a time on the server's line thread, so they never
+        # interleave and capturing stdout for one of them is safe
+        with capture_output(output):
+            try:
+                # Clients can't reach files on the host running the bot
+                execute_pipeline(
+                    commands,
+                    stop_on_error=stop_on_error,
+                    reports=reports,
+                    remote=True,
+                    **context,
+                )
+            except StopCommandsLoop:
+                stop = True
+
+    return output.getvalue(), stop
+
+
+async def handle_session(
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    *,
+    executor: Executor,
+    stop_on_error: bool = False,
+    **context: Any,
+) -> None:
+    loop = asyncio.get_running_loop()
+    reports = BackgroundReports()
+    try:
+        while line := await reader.readline():
+            # Commands block on the book, the event loop keeps serving other
+            # clients meanwhile
+            output, stop = await loop.run_in_executor(
+                executor,
+                partial(
+                    run_line,
+                    line.decode(errors="replace"),
+                    stop_on_error=stop_on_error,
+                    reports=reports,
+                    **context,
+                ),
+            )
+            # Reports started by the line run in the pool while other clients
+            # are served, their output ends its response
+            for _, future in reports.pop_started():
+                output += await asyncio.wrap_future(future)
+            writer.write(output.encode() + RESPONSE_END)
+            await writer.drain()
+            if stop:
+                break
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(address: str, *, stop_on_error: bool = False, **context: Any) -> None:
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bot-lines")
+
+    async def on_connect(
+        reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        await handle_session(
+            reader,
+            writer,
+            executor=executor,
+            stop_on_error=stop_on_error,
+            **context,
+        )
+
+    host, port = parse_address(address)
+    if host == "unix":
+        server = await asyncio.start_unix_server(
+            on_connect, path=str(port), backlog=BACKLOG
+        )
+    else:
+        server = await asyncio.start_server(on_connect, host, port, backlog=BACKLOG)
+
+    try:
+        async with server:
+            print(f"Serving the assistant bot on {address}")
+            await server.serve_forever()
+    finally:
+        executor.shutdown(cancel_futures=True)
+        if host == "unix":
+            Path(str(port)).unlink(missing_ok=True)
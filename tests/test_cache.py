@@ -0,0 +1,19 @@
+from bot.contacts import ContactsBook
+from bot.contacts.cache import QueryCache
+
+
+def test_results_are_capped_by_the_items_they_hold():
+    cache = QueryCache(ContactsBook(), max_items=5)
+
+    cache.get("small", lambda: [1, 2, 3])
+    cache.get("other", lambda: [4, 5])
+    assert len(cache) == 2
+
+    # Evicts the oldest result to make room
+    cache.get("third", lambda: [6])
+    assert cache.get("small", lambda: None) is None
+    assert cache.get("third", lambda: None) == [6]
+
+    # Too big to cache at all
+    cache.get("whole book", lambda: list(range(10)))
+    assert cache.get("whole book", lambda: None) is None
@@ -0,0 +1,89 @@
+import sys
+import threading
+
+import pytest
+
+from bot.contacts import (
+    AutoSaver,
+    ContactRow,
+    ContactsBook,
+    ContactsJournal,
+    ContactsService,
+)
+
+
+@pytest.fixture
+def tiny_switch_interval():
+    # Threads switch far more often, so races show up within a short test
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(interval)
+
+
+def test_compaction_check_while_autosave_compacts(tmp_path, tiny_switch_interval):
+    path = tmp_path / "contacts.map"
+    contacts = ContactsBook.from_file(path)
+    journal = ContactsJournal(path, compaction_threshold=200)
+    service = ContactsService(contacts, journal=journal)
+    saver = AutoSaver(
+        contacts, journal, interval=0.0, max_mutations=1, poll_interval=0.0005
+    )
+    errors: list[Exception] = []
+    stopped = threading.Event()
+
+    def check_compaction() -> None:
+        while not stopped.is_set():
+            try:
+                journal.compaction_due
+            except Exception as e:
+                errors.append(e)
+
+    checker = threading.Thread(target=check_compaction)
+    saver.start()
+    checker.start()
+    try:
+        for i in range(300):
+            # Like execute_command: changes under the book lock, compaction after
+            with contacts.lock:
+                service.create_contact(f"Contact {i}", phone=f"{i:010d}")
+            service.compact_if_due()
+    finally:
+        stopped.set()
+        checker.join()
+        saver.stop()
+    journal.compact(contacts)
+    journal.close()
+
+    assert errors == []
+    assert saver.saves > 0
+    assert len(ContactsBook.from_file(path)) == 300
+
+
+def test_bulk_rows_and_later_changes_are_replayed_after_a_crash(tmp_path):
+    path = tmp_path / "contacts.map"
+    contacts = ContactsBook.from_file(path)
+    journal = ContactsJournal(path)
+    service = ContactsService(contacts, journal=journal)
+    rows = [
+        ContactRow(number=1, name="Ann", phones=["0123456789"], birthday=None),
+        ContactRow(
+            number=2,
+            name="Bob",
+            phones=["0123456780", "0123456781"],
+            birthday="01.02.2000",
+        ),
+    ]
+    service.create_contacts_bulk(rows)
+    # Saving is due now, but the session ends before it gets to it
+    service.create_contact("Carol", phone="0123456782")
+    journal.close()
+
+    recovered = ContactsBook.from_file(path)
+
+    assert sorted(recovered.data) == ["Ann", "Bob", "Carol"]
+    assert [p.value for p in recovered.data["Bob"].phones] == [
+        "0123456780",
+        "0123456781",
+    ]
+    assert recovered.data["Bob"].get_birthday("%d.%m.%Y") == "01.02.2000"
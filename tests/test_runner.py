@@ -0,0 +1,61 @@
+import pytest
+
+from bot.contacts import ContactsBook, ContactsJournal, ContactsService
+from bot.runner import commands_dispatcher, execute_pipeline
+
+
+@pytest.fixture
+def context(tmp_path):
+    path = tmp_path / "contacts.map"
+    contacts = ContactsBook.from_file(path)
+    journal = ContactsJournal(path)
+    yield {
+        "contacts": contacts,
+        "contacts_service": ContactsService(contacts, journal=journal),
+        "command_stats": None,
+        "journal": journal,
+    }
+    journal.close()
+
+
+def run(line: str, context, **options) -> int:
+    commands = commands_dispatcher.parse_pipeline(line)
+    return execute_pipeline(
+        commands,
+        contacts=context["contacts"],
+        contacts_service=context["contacts_service"],
+        command_stats=context["command_stats"],
+        **options,
+    )
+
+
+def test_interrupted_pipeline_is_rolled_back(context, monkeypatch):
+    run("add alice 0123456789", context)
+
+    def interrupt(*args, **kwargs):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(ContactsService, "add_birthday", interrupt)
+    with pytest.raises(KeyboardInterrupt):
+        run(
+            "add bob 0123456780; change alice 0123456789 0111111111;"
+            " add-birthday bob 01.02.2000",
+            context,
+        )
+
+    contacts = context["contacts"]
+    assert sorted(contacts.data) == ["alice"]
+    assert [p.value for p in contacts.data["alice"].phones] == ["0123456789"]
+    # Only the first line made it to the journal
+    journal = context["journal"]
+    entries = list(ContactsJournal.read(journal.path))
+    assert [entry["op"] for entry in entries] == ["create"]
+
+
+def test_failed_commands_are_counted(context, capsys):
+    line = "add alice 0123456789; change nobody 0123456789 0111111111"
+    assert run(line, context) == 1
+    assert run("add alice 0123456789; phone nobody; hello", context) == 2
+    assert run("phone nobody; add bob 0123456780", context, stop_on_error=True) == 1
+    assert "bob" not in context["contacts"].data
+    assert "Contact doesn't exist." in capsys.readouterr().out
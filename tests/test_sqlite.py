@@ -0,0 +1,47 @@
+from bot.contacts import ContactRecord, ContactsBook
+
+
+def add_contact(contacts: ContactsBook, name: str, phone: str) -> None:
+    record = ContactRecord(name)
+    record.add_phone(phone)
+    contacts.add_record(record)
+
+
+def names(records) -> list[str]:
+    return [record.name.value for record in records]
+
+
+def test_name_queries_see_commits_of_another_connection(tmp_path):
+    path = tmp_path / "contacts.db"
+    contacts = ContactsBook.from_file(path)
+    add_contact(contacts, "alice", "0123456789")
+    add_contact(contacts, "bob", "0123456780")
+    assert names(contacts.cursor(sort="name")) == ["alice", "bob"]
+
+    other = ContactsBook.from_file(path)
+    other.delete("bob")
+    add_contact(other, "carol", "0123456781")
+
+    assert names(contacts.cursor(sort="name")) == ["alice", "carol"]
+    assert names(contacts.search("caro")) == ["carol"]
+    other.close()
+    contacts.close()
+
+
+def test_changes_are_rolled_back_together(tmp_path):
+    contacts = ContactsBook.from_file(tmp_path / "contacts.db")
+    add_contact(contacts, "alice", "0123456789")
+
+    try:
+        with contacts.batch():
+            add_contact(contacts, "bob", "0123456780")
+            contacts.delete("alice")
+            raise RuntimeError
+    except RuntimeError:
+        pass
+
+    assert sorted(contacts.data) == ["alice"]
+    contacts.close()
+    reopened = ContactsBook.from_file(tmp_path / "contacts.db")
+    assert sorted(reopened.data) == ["alice"]
+    reopened.close()
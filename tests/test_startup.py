@@ -0,0 +1,23 @@
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Only needed by some commands or options, imported when they are used
+DEFERRED_MODULES = ["asyncio", "bz2", "lzma", "sqlite3", "bot.server"]
+
+
+def test_bot_imports_no_deferred_modules():
+    check = (
+        "import sys, bot.__main__; "
+        f"print(*[m for m in {DEFERRED_MODULES!r} if m in sys.modules])"
+    )
+    process = subprocess.run(
+        [sys.executable, "-c", check],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert process.stdout.split() == []
@@ -0,0 +1,87 @@
+import pytest
+
+from bot.contacts import ContactRecord, ContactsBook
+
+
+@pytest.fixture(params=["mapped", "sharded"])
+def book_path(request, tmp_path):
+    backend = request.param
+    path = tmp_path / ("contacts" if backend == "sharded" else "contacts.map")
+    contacts = ContactsBook.from_file(path, backend=backend)
+    add_contact(contacts, "alice", "0123456789")
+    contacts.save(path)
+    contacts.close()
+    return path
+
+
+def add_contact(contacts: ContactsBook, name: str, phone: str) -> None:
+    record = ContactRecord(name)
+    record.add_phone(phone)
+    contacts.add_record(record)
+
+
+def phones(contacts: ContactsBook) -> dict[str, list[str]]:
+    return {
+        name: [phone.value for phone in record.phones]
+        for name, record in contacts.items()
+    }
+
+
+def test_saved_book_is_loaded_back(book_path):
+    contacts = ContactsBook.from_file(book_path)
+    add_contact(contacts, "bob", "0123456780")
+    contacts.data["alice"].add_birthday("01.02.2000")
+    contacts.save(book_path)
+    contacts.close()
+
+    loaded = ContactsBook.from_file(book_path)
+    assert phones(loaded) == {"alice": ["0123456789"], "bob": ["0123456780"]}
+    assert loaded.data["alice"].get_birthday("%d.%m.%Y") == "01.02.2000"
+    assert not loaded.is_dirty
+
+
+def test_concurrent_saves_are_merged(book_path):
+    first = ContactsBook.from_file(book_path)
+    second = ContactsBook.from_file(book_path)
+    add_contact(first, "bob", "0123456780")
+    add_contact(second, "carol", "0123456781")
+    second.data["alice"].edit_phone("0123456789", "0111111111")
+
+    assert first.save(book_path) == []
+    assert second.save(book_path) == []
+
+    assert phones(second) == {
+        "alice": ["0111111111"],
+        "bob": ["0123456780"],
+        "carol": ["0123456781"],
+    }
+    loaded = ContactsBook.from_file(book_path)
+    assert phones(loaded) == phones(second)
+
+
+def test_conflicting_saves_keep_the_last_one_and_report_it(book_path):
+    first = ContactsBook.from_file(book_path)
+    second = ContactsBook.from_file(book_path)
+    first.data["alice"].edit_phone("0123456789", "0111111111")
+    second.delete("alice")
+
+    assert first.save(book_path) == []
+    assert second.save(book_path) == ["alice"]
+
+    assert phones(ContactsBook.from_file(book_path)) == {}
+
+
+def test_snapshot_keeps_the_records_as_they_were(book_path):
+    contacts = ContactsBook.from_file(book_path)
+    add_contact(contacts, "bob", "0123456780")
+    snapshot = contacts.snapshot()
+
+    contacts.data["alice"].add_phone("0111111111")
+    contacts.delete("bob")
+    add_contact(contacts, "carol", "0123456781")
+
+    assert phones(snapshot) == {"alice": ["0123456789"], "bob": ["0123456780"]}
+    assert phones(contacts) == {
+        "alice": ["0123456789", "0111111111"],
+        "carol": ["0123456781"],
+    }